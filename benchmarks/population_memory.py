@@ -0,0 +1,107 @@
+# Run from the repository root: python -m benchmarks.population_memory
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+
+from population import PopulationStore
+from seeding import Seeding
+from sim import Organism, Simulation
+
+FAMILIES = ["A", "B", "C", "D", "E"]
+
+
+def measure(build):
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = build()
+    seconds = time.perf_counter() - started
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current, peak, seconds
+
+
+def build_objects(count, rng):
+    organisms = []
+    for family, strength, x, y in zip(
+        rng.integers(0, 5, count).tolist(), rng.integers(1, 11, count).tolist(),
+        rng.integers(0, 1000, count).tolist(), rng.integers(0, 1000, count).tolist(),
+    ):
+        organism = Organism(family, strength)
+        organism.x, organism.y = x, y
+        organisms.append(organism)
+    return organisms
+
+
+def build_store(count, rng):
+    store = PopulationStore(FAMILIES, capacity=count)
+    store.add_many(rng.integers(0, 5, count), rng.integers(1, 11, count), rng.integers(0, 1000, count), rng.integers(0, 1000, count))
+    return store
+
+
+def churn_objects(organisms, turnover, rounds, rng):
+    # What run_simulation does: rebuild the list with survivors and newborns.
+    for _ in range(rounds):
+        dead = rng.random(len(organisms)) < turnover
+        survivors = [organism for organism, died in zip(organisms, dead.tolist()) if not died]
+        survivors.extend(Organism(0, 4) for _ in range(int(dead.sum())))
+        organisms = survivors
+    return organisms
+
+
+def churn_store(store, turnover, rounds, rng):
+    for _ in range(rounds):
+        live = store.live_slots()
+        dead = live[rng.random(len(live)) < turnover]
+        store.remove_many(dead)
+        store.add_many(np.zeros(len(dead), dtype=np.int32), 4, 0, 0)
+    return store
+
+
+def simulation_run(store, size, count, steps):
+    # Traced bytes per organism of a whole object-engine simulation (grid
+    # included) right after seeding, and seconds per step.
+    tracemalloc.start()
+    simulation = Simulation(size, size, size * size * 3 // 10, seed=0, seeding=Seeding(count // 5, "3-9"), store=store)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    started = time.perf_counter()
+    for _ in range(steps):
+        simulation.step()
+    return current / count, (time.perf_counter() - started) / steps
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Per-organism memory and allocation churn of the population stores.")
+    parser.add_argument("--count", type=int, default=1_000_000, help="live organisms (default: 1000000)")
+    parser.add_argument("--turnover", type=float, default=0.1, help="fraction replaced per round (default: 0.1)")
+    parser.add_argument("--rounds", type=int, default=10, help="churn rounds (default: 10)")
+    parser.add_argument("--sim-size", type=int, default=1000, help="grid side of the simulation comparison (default: 1000)")
+    parser.add_argument("--sim-count", type=int, default=200_000, help="organisms seeded in the simulation comparison (default: 200000)")
+    parser.add_argument("--sim-steps", type=int, default=3, help="steps timed in the simulation comparison (default: 3)")
+    args = parser.parse_args(argv)
+    rng = np.random.default_rng(0)
+
+    print(f"{'store':<18}{'bytes/organism':>16}{'build s':>10}{'churn peak MB':>15}{'churn s/round':>15}")
+    organisms, current, _, seconds = measure(lambda: build_objects(args.count, rng))
+    _, _, peak, churn_seconds = measure(lambda: churn_objects(organisms, args.turnover, args.rounds, rng))
+    print(f"{'Organism list':<18}{current / args.count:>16.1f}{seconds:>10.2f}{peak / 2**20:>15.1f}{churn_seconds / args.rounds:>15.3f}")
+    del organisms
+
+    store, current, _, seconds = measure(lambda: build_store(args.count, rng))
+    _, _, peak, churn_seconds = measure(lambda: churn_store(store, args.turnover, args.rounds, rng))
+    print(f"{'PopulationStore':<18}{current / args.count:>16.1f}{seconds:>10.2f}{peak / 2**20:>15.1f}{churn_seconds / args.rounds:>15.3f}")
+    del store
+
+    # The same comparison inside a running object engine, where every live
+    # organism on the grid is an OrganismView of the store.
+    print(f"\n{args.sim_size}x{args.sim_size} simulation, {args.sim_count} organisms")
+    print(f"{'engine':<18}{'bytes/organism':>16}{'s/step':>10}")
+    for label, store in (("Organism", False), ("--store", True)):
+        per_organism, per_step = simulation_run(store, args.sim_size, args.sim_count, args.sim_steps)
+        print(f"{label:<18}{per_organism:>16.1f}{per_step:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+# Run from the repository root: python -m benchmarks.throughput --out results.json
+import argparse
+import itertools
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from sim import Simulation, resource_count
+from sweep import parse_size
+
+# Metrics where a larger value is better; the others regress when they grow.
+HIGHER_IS_BETTER = {"updates_per_second", "steps_per_second"}
+COMPARED = ["updates_per_second", "steps_per_second", "p50_ms", "p95_ms", "p99_ms", "peak_mb"]
+
+
+def cases(sizes, densities, steps, engines):
+    return [
+        {"engine": engine, "width": width, "height": height, "density": density, "steps": count}
+        for engine, (width, height), density, count in itertools.product(engines, sizes, densities, steps)
+    ]
+
+
+def case_key(case):
+    return f"{case['engine']} {case['width']}x{case['height']} d{case['density']} s{case['steps']}"
+
+
+def build(case, seed):
+    den = resource_count(case["width"], case["height"], case["density"])
+    return Simulation(case["width"], case["height"], den, engine=case["engine"], seed=seed)
+
+
+def time_run(case, seed):
+    # Times every step on its own. A step updates every organism alive when
+    # it starts, so the population before the step counts as its updates.
+    simulation = build(case, seed)
+    latencies = []
+    updates = 0
+    clock = time.perf_counter
+    try:
+        for _ in range(case["steps"]):
+            if simulation.is_full():
+                break
+            updates += simulation.population()
+            started = clock()
+            simulation.step()
+            latencies.append(clock() - started)
+    finally:
+        simulation.close()
+    return np.array(latencies), updates
+
+
+def peak_memory(case, seed):
+    # A separate run, since tracing allocations slows the object engine down
+    # several times over.
+    tracemalloc.start()
+    try:
+        simulation = build(case, seed)
+        simulation.run(case["steps"])
+        simulation.close()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def measure(case, seed=0, repeat=1, memory=True):
+    best = None
+    for _ in range(repeat):
+        latencies, updates = time_run(case, seed)
+        if best is None or latencies.sum() < best[0].sum():
+            best = latencies, updates
+    latencies, updates = best
+    seconds = float(latencies.sum())
+    result = dict(case)
+    result.update({
+        "steps_run": len(latencies),
+        "agent_updates": updates,
+        "seconds": round(seconds, 6),
+        "updates_per_second": round(updates / seconds, 1) if seconds else 0.0,
+        "steps_per_second": round(len(latencies) / seconds, 2) if seconds else 0.0,
+    })
+    for percentile in (50, 95, 99):
+        value = np.percentile(latencies, percentile) * 1000 if len(latencies) else 0.0
+        result[f"p{percentile}_ms"] = round(float(value), 4)
+    result["peak_mb"] = round(peak_memory(case, seed) / 2**20, 3) if memory else None
+    return result
+
+
+def compare(results, baseline, threshold):
+    # Returns (case, metric, baseline value, new value, relative change) for
+    # every metric that got worse by more than threshold.
+    previous = {case_key(result): result for result in baseline["results"]}
+    regressions = []
+    for result in results:
+        old = previous.get(case_key(result))
+        if old is None:
+            continue
+        for metric in COMPARED:
+            before, after = old.get(metric), result.get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            worse = -change if metric in HIGHER_IS_BETTER else change
+            if worse > threshold:
+                regressions.append((case_key(result), metric, before, after, change))
+    return regressions
+
+
+HEADER = f"{'case':<32}{'steps':>7}{'updates/s':>13}{'steps/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'peak MB':>9}"
+
+
+def row(result):
+    peak = "-" if result["peak_mb"] is None else f"{result['peak_mb']:.1f}"
+    return (
+        f"{case_key(result):<32}{result['steps_run']:>7}{result['updates_per_second']:>13.0f}"
+        f"{result['steps_per_second']:>10.1f}{result['p50_ms']:>9.3f}{result['p95_ms']:>9.3f}"
+        f"{result['p99_ms']:>9.3f}{peak:>9}"
+    )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Seeded, render-free step throughput benchmarks.")
+    parser.add_argument("--size", type=parse_size, nargs="+", default=[(50, 30), (100, 60), (200, 120)], help="grid sizes as WxH (default: 50x30 100x60 200x120)")
+    parser.add_argument("--density", type=int, nargs="+", default=[10, 30, 60], help="resource densities 0-100 (default: 10 30 60)")
+    parser.add_argument("--steps", type=int, nargs="+", default=[200], help="steps per run (default: 200)")
+    parser.add_argument("--engine", choices=["object", "array", "parallel"], nargs="+", default=["object", "array"], help="engines (default: object array)")
+    parser.add_argument("--seed", type=int, default=0, help="seed for every run (default: 0)")
+    parser.add_argument("--repeat", type=int, default=1, help="timed runs per case; the fastest is kept (default: 1)")
+    parser.add_argument("--no-memory", action="store_true", help="skip the extra run that measures peak memory")
+    parser.add_argument("--out", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare against the results in this JSON file")
+    parser.add_argument("--threshold", type=float, default=0.1, help="relative change counted as a regression (default: 0.1)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = []
+    print(HEADER)
+    for case in cases(args.size, args.density, args.steps, args.engine):
+        results.append(measure(case, args.seed, args.repeat, not args.no_memory))
+        print(row(results[-1]), flush=True)
+    document = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "seed": args.seed,
+        "results": results,
+    }
+    if args.out:
+        with open(args.out, "w") as out:
+            json.dump(document, out, indent=2)
+    if args.baseline:
+        with open(args.baseline) as source:
+            regressions = compare(results, json.load(source), args.threshold)
+        for key, metric, before, after, change in regressions:
+            print(f"REGRESSION {key}: {metric} {before} -> {after} ({change:+.1%})")
+        if regressions:
+            sys.exit(1)
+        print(f"no regressions beyond {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+import json
+import os
+import random
+import threading
+from array import array
+
+import numpy as np
+
+from engine import ArrayWorld
+from families import COLUMNS, FamilyTable
+from population import PopulationStore
+from sim import Grid, LazyResourceField, Organism, RegrowingResources, ResourceField, Simulation, SparseGrid
+
+FORMAT_VERSION = 1
+STAT_KEYS = ["steps", "fights", "cooperations"]
+
+
+def capture(simulation):
+    # Returns the whole state as plain arrays. Everything is copied, so the
+    # result can be written out while the simulation keeps stepping.
+    if simulation.engine == "parallel":
+        raise ValueError("the parallel engine cannot be checkpointed")
+    meta = {
+        "version": FORMAT_VERSION,
+        "engine": simulation.engine,
+        "width": simulation.width,
+        "height": simulation.height,
+        "den": simulation.den,
+        "step_count": simulation.step_count,
+    }
+    space = simulation.world if simulation.engine == "array" else simulation.grid
+    meta["topology"] = space.topology
+    meta["neighbourhood"] = space.neighbourhood
+    if simulation.engine == "array":
+        world = simulation.world
+        meta["families"] = world.families
+        meta["rng"] = world.rng.bit_generator.state
+        arrays = {
+            "x": world.x.astype(np.uint32),
+            "y": world.y.astype(np.uint32),
+            "family": world.family.astype(np.int32),
+            "strength": world.strength.astype(np.int8),
+            "stats": world.stats.copy(),
+        }
+        if world.resources is not None:
+            meta["regrowth"] = world.regrowth
+            arrays["resources"] = world.resources.astype(np.int8)
+            arrays["pending_cell"] = world.pending_cell.copy()
+            arrays["pending_step"] = world.pending_step.copy()
+    else:
+        grid = simulation.grid
+        organisms = simulation.organisms
+        table = simulation.family_table
+        version, internal, gauss_next = simulation.rng.getstate()
+        meta["families"] = simulation.families
+        meta["rng"] = {"version": version, "gauss_next": gauss_next}
+        meta["sparse"] = isinstance(grid, SparseGrid)
+        meta["synchronous"] = simulation.synchronous
+        meta["store"] = simulation.store is not None
+        arrays = {
+            # The organism list can hold organisms that were displaced from
+            # the grid by a move, so whether each one is on the grid is kept.
+            "x": np.array([organism.x for organism in organisms], dtype=np.uint32),
+            "y": np.array([organism.y for organism in organisms], dtype=np.uint32),
+            "family": np.array([organism.family for organism in organisms], dtype=np.int32),
+            "strength": np.array([organism.strength for organism in organisms], dtype=np.int8),
+            "on_grid": np.array(
+                [grid.get_organism(organism.x, organism.y) is organism for organism in organisms], dtype=bool
+            ),
+            "stats": np.array([getattr(table, key) for key in STAT_KEYS], dtype=np.int64).T.reshape(len(table), len(STAT_KEYS)),
+            "family_counters": np.array(table.columns(), dtype=np.int64).reshape(len(COLUMNS), len(table)),
+            "rng_state": np.array(internal, dtype=np.uint32),
+        }
+        if not meta["sparse"]:
+            arrays["free_cells"] = np.frombuffer(grid.free_cells, dtype="l").astype(np.uint32)
+        if simulation.resources is not None:
+            arrays.update(capture_resources(simulation.resources, meta))
+    arrays["meta"] = np.array(json.dumps(meta))
+    return arrays
+
+
+def capture_resources(resources, meta):
+    # The object engine's persistent resources: the field (a width x height
+    # array, or the cells a sparse grid has looked at so far) and the cells
+    # waiting to regrow with the step they regrow at.
+    meta["regrowth"] = resources.regrowth
+    meta["resource_step"] = resources.step
+    meta["resource_density"] = getattr(resources.field, "density", None)
+    pending = [(step, x, y) for step, cells in resources.pending.items() for x, y in cells]
+    arrays = {"pending": np.array(pending, dtype=np.int64).reshape(len(pending), 3)}
+    if isinstance(resources.field, LazyResourceField):
+        values = resources.field.values
+        arrays["resource_cells"] = np.array(list(values.keys()), dtype=np.uint32).reshape(len(values), 2)
+        arrays["resource_values"] = np.array(list(values.values()), dtype=np.int8)
+    else:
+        arrays["resources"] = np.array(resources.field.values, dtype=np.int8)
+    return arrays
+
+
+def restore_resources(state, meta, rng):
+    if meta["resource_density"] is not None:
+        field = LazyResourceField(meta["resource_density"], rng)
+        cells = state["resource_cells"].tolist()
+        field.values = dict(zip(map(tuple, cells), state["resource_values"].tolist()))
+    else:
+        field = ResourceField(state["resources"].tolist())
+    resources = RegrowingResources(field, meta["regrowth"], rng)
+    resources.step = meta["resource_step"]
+    for step, x, y in state["pending"].tolist():
+        resources.pending.setdefault(step, []).append((x, y))
+    return resources
+
+
+def write(state, path):
+    temporary = path + ".tmp"
+    with open(temporary, "wb") as out:
+        np.savez(out, **state)
+    os.replace(temporary, path)
+
+
+def save(simulation, path):
+    write(capture(simulation), path)
+
+
+def load(path):
+    with np.load(path) as data:
+        state = {name: data[name] for name in data.files}
+    meta = json.loads(str(state["meta"]))
+    if meta["version"] != FORMAT_VERSION:
+        raise ValueError(f"unsupported checkpoint version {meta['version']}")
+
+    simulation = Simulation.__new__(Simulation)
+    simulation.den = meta["den"]
+    simulation.engine = meta["engine"]
+    simulation.step_count = meta["step_count"]
+    simulation.observers = []
+    families = meta["families"]
+    simulation.families = families
+    topology = meta.get("topology", "bounded")
+    neighbourhood = meta.get("neighbourhood", "von-neumann")
+
+    if meta["engine"] == "array":
+        rng = np.random.default_rng()
+        rng.bit_generator.state = meta["rng"]
+        world = ArrayWorld(meta["width"], meta["height"], families, rng, topology, neighbourhood)
+        world.x = state["x"].astype(np.int64)
+        world.y = state["y"].astype(np.int64)
+        world.family = state["family"].astype(np.int64)
+        world.strength = state["strength"].astype(np.int64)
+        world.occupant[world.cells()] = np.arange(world.size)
+        world.stats = state["stats"]
+        world.step_count = meta["step_count"]
+        if "regrowth" in meta:
+            world.resources = state["resources"].astype(np.int64)
+            world.regrowth = meta["regrowth"]
+            world.pending_cell = state["pending_cell"]
+            world.pending_step = state["pending_step"]
+        simulation.world = world
+        return simulation
+
+    rng = random.Random()
+    rng.setstate((meta["rng"]["version"], tuple(state["rng_state"].tolist()), meta["rng"]["gauss_next"]))
+    sparse = meta.get("sparse", False)
+    if sparse:
+        grid = SparseGrid(meta["width"], meta["height"], topology=topology, neighbourhood=neighbourhood)
+    else:
+        grid = Grid(meta["width"], meta["height"], topology, neighbourhood)
+    new = Organism
+    if meta.get("store", False):
+        simulation.store = PopulationStore(families, capacity=max(len(state["x"]), 1))
+        new = simulation.store.new
+    organisms = []
+    for x, y, family, strength, on_grid in zip(
+        state["x"].tolist(), state["y"].tolist(), state["family"].tolist(),
+        state["strength"].tolist(), state["on_grid"].tolist(),
+    ):
+        organism = new(family, strength)
+        organism.x, organism.y = x, y
+        if on_grid and sparse:
+            grid.place_organism(organism, x, y)
+        elif on_grid:
+            grid.cells[x][y] = organism
+        organisms.append(organism)
+    if not sparse:
+        free_cells = state["free_cells"].astype("l")
+        free_index = np.full(grid.width * grid.height, -1, dtype="l")
+        free_index[free_cells] = np.arange(len(free_cells))
+        grid.free_cells = array("l", free_cells.tobytes())
+        grid.free_index = array("l", free_index.tobytes())
+    table = FamilyTable(families)
+    if "family_counters" in state:
+        for column, values in zip(COLUMNS, state["family_counters"].tolist()):
+            setattr(table, column, values)
+    else:
+        # Written before the family table existed: only the stats were kept.
+        table.count(organisms)
+        for key, values in zip(STAT_KEYS, state["stats"].T.tolist()):
+            setattr(table, key, values)
+    simulation.rng = rng
+    simulation.grid = grid
+    simulation.organisms = organisms
+    simulation.family_table = table
+    simulation.synchronous = meta.get("synchronous", False)
+    if "regrowth" in meta:
+        simulation.resources = restore_resources(state, meta, rng)
+    return simulation
+
+
+class Checkpointer:
+    # Observer that saves a checkpoint every `every` steps. The state is
+    # captured on the stepping thread and written from a background thread,
+    # so the step loop only waits if the previous write has not finished.
+    def __init__(self, path, every):
+        self.path = path
+        self.every = every
+        self.thread = None
+        self.error = None
+
+    def __call__(self, simulation):
+        if simulation.step_count % self.every:
+            return
+        state = capture(simulation)
+        self.wait()
+        path = self.path.format(step=simulation.step_count)
+        self.thread = threading.Thread(target=self._write, args=(state, path), daemon=True)
+        self.thread.start()
+
+    def _write(self, state, path):
+        try:
+            write(state, path)
+        except Exception as error:
+            self.error = error
+
+    def wait(self):
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def close(self):
+        self.wait()
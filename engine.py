@@ -0,0 +1,325 @@
+import numpy as np
+
+from families import FAMILIES
+from outcomes import DEFAULT_OUTCOMES, MAX_RESOURCE, MAX_STRENGTH
+from topology import VON_NEUMANN, MoveTable
+
+REPRODUCTION_STRENGTH = 8
+OFFSPRING_STRENGTH = 4
+
+# Same order as Grid.get_valid_adjacent_cells. It doubles as the tie-break
+# when two equally strong organisms move towards the same cell: the one
+# arriving along the earlier direction gets to claim it.
+DIRECTIONS = np.array(VON_NEUMANN, dtype=np.int64)
+
+STEPS, FIGHTS, COOPERATIONS = 0, 1, 2
+
+
+def resolve_interactions(outcomes, family, strength, attacker, defender, resource_value):
+    # Settles a batch of collisions with one gather from an OutcomeTable.
+    fight, attacker_wins, attacker_delta, defender_delta = outcomes.gather(
+        family[attacker] == family[defender], strength[attacker], strength[defender], resource_value
+    )
+    winner = np.where(attacker_wins, attacker, defender)
+    loser = np.where(attacker_wins, defender, attacker)
+    return fight, winner, loser, attacker_delta, defender_delta
+
+
+class ArrayWorld:
+    # Set to an events.EventStream to get births, deaths, fights,
+    # cooperations and resource consumption as batched records.
+    events = None
+    # The per-cell resources kept between steps after persist_resources();
+    # None while fresh resources are scattered every step.
+    resources = None
+    # How collisions are settled; an outcomes.OutcomeTable.
+    outcomes = DEFAULT_OUTCOMES
+    # The last step's collisions, fights, cooperations, births and deaths, as
+    # counted by metrics.Profiler for the object engine.
+    counts = None
+
+    def __init__(self, width, height, families=FAMILIES, rng=None, topology="bounded", neighbourhood="von-neumann"):
+        if width * height < 2:
+            raise ValueError("the grid needs at least two cells")
+        self.width = width
+        self.height = height
+        self.topology = topology
+        self.neighbourhood = neighbourhood
+        self.move_table = MoveTable(width, height, topology, neighbourhood)
+        self.families = list(families)
+        self.rng = rng if rng is not None else np.random.default_rng()
+        # Cells are numbered x * height + y, the same layout as Grid.cells.
+        self.occupant = np.full(width * height, -1, dtype=np.int64)
+        self.x = np.empty(0, dtype=np.int64)
+        self.y = np.empty(0, dtype=np.int64)
+        self.family = np.empty(0, dtype=np.int64)
+        self.strength = np.empty(0, dtype=np.int64)
+        self.stats = np.zeros((len(self.families), 3), dtype=np.int64)
+        self.step_count = 0
+
+    @classmethod
+    def from_grid(cls, grid, organisms, rng=None, families=None):
+        # With families (the labels of a Simulation's integer family ids),
+        # the organisms' families are taken as indexes into it.
+        organisms = [o for o in organisms if grid.get_organism(o.x, o.y) is o]
+        if families is None:
+            families = sorted({o.family for o in organisms})
+            index = {family: i for i, family in enumerate(families)}
+        else:
+            index = range(len(families))
+        world = cls(grid.width, grid.height, families, rng, grid.topology, grid.neighbourhood)
+        world.add(
+            [o.x for o in organisms],
+            [o.y for o in organisms],
+            [index[o.family] for o in organisms],
+            [o.strength for o in organisms],
+        )
+        return world
+
+    @property
+    def size(self):
+        return len(self.x)
+
+    @property
+    def full(self):
+        return self.size >= self.width * self.height
+
+    def cells(self):
+        return self.x * self.height + self.y
+
+    def add(self, x, y, family, strength=5):
+        x, y, family, strength = np.broadcast_arrays(
+            np.asarray(x, dtype=np.int64),
+            np.asarray(y, dtype=np.int64),
+            np.asarray(family, dtype=np.int64),
+            np.asarray(strength, dtype=np.int64),
+        )
+        if ((x < 0) | (x >= self.width) | (y < 0) | (y >= self.height)).any():
+            raise ValueError("organism placed outside the grid")
+        cells = x * self.height + y
+        if (self.occupant[cells] >= 0).any():
+            raise ValueError("cell is already occupied")
+        # Two new organisms on one cell show up as one overwriting the other.
+        index = np.arange(self.size, self.size + len(cells))
+        self.occupant[cells] = index
+        if (self.occupant[cells] != index).any():
+            self.occupant[cells] = -1
+            raise ValueError("cell is already occupied")
+        self.x = np.concatenate([self.x, x])
+        self.y = np.concatenate([self.y, y])
+        self.family = np.concatenate([self.family, family])
+        self.strength = np.concatenate([self.strength, strength])
+
+    def place_initial(self, per_family=1, strength=5):
+        count = len(self.families) * per_family
+        if count > self.width * self.height:
+            raise ValueError(f"{count} organisms do not fit on a {self.width}x{self.height} grid")
+        cells = self.rng.choice(self.width * self.height, size=count, replace=False, shuffle=False)
+        cells = self.rng.permutation(cells)
+        family = np.repeat(np.arange(len(self.families)), per_family)
+        self.add(cells // self.height, cells % self.height, family, strength)
+
+    def labels(self, family):
+        return np.asarray(self.families)[family]
+
+    def family_grid(self):
+        grid = np.full((self.width, self.height), -1, dtype=np.int64)
+        grid[self.x, self.y] = self.family
+        return grid
+
+    def family_stats(self):
+        return {
+            label: {"steps": int(row[STEPS]), "fights": int(row[FIGHTS]), "cooperations": int(row[COOPERATIONS])}
+            for label, row in zip(self.families, self.stats)
+            if row.any()
+        }
+
+    def scatter_resources(self, den):
+        area = self.width * self.height
+        den = min(den, area)
+        resources = np.zeros(area, dtype=np.int64)
+        cells = self.rng.choice(area, size=den, replace=False, shuffle=False)
+        resources[cells] = self.rng.integers(1, MAX_RESOURCE + 1, size=den)
+        return resources
+
+    def persist_resources(self, den, regrowth):
+        # From now on resources stay until eaten. An eaten cell regrows after
+        # a geometric delay (probability `regrowth` per step), kept as the
+        # pending cells and the step each of them regrows at, so a step costs
+        # time in proportion to what is eaten and pending rather than to the
+        # grid area.
+        self.resources = self.scatter_resources(den)
+        self.regrowth = regrowth
+        self.pending_cell = np.empty(0, dtype=np.int64)
+        self.pending_step = np.empty(0, dtype=np.int64)
+
+    def regrow(self, step):
+        due = self.pending_step <= step
+        if due.any():
+            cells = self.pending_cell[due]
+            self.resources[cells] = self.rng.integers(1, MAX_RESOURCE + 1, size=len(cells))
+            self.pending_cell = self.pending_cell[~due]
+            self.pending_step = self.pending_step[~due]
+
+    def eat(self, cells, step):
+        found = self.resources[cells]
+        eaten = cells[found > 0]
+        self.resources[eaten] = 0
+        if self.regrowth > 0:
+            delay = self.rng.geometric(min(self.regrowth, 1.0), size=len(eaten))
+            self.pending_cell = np.concatenate([self.pending_cell, eaten])
+            self.pending_step = np.concatenate([self.pending_step, step + delay])
+        return found
+
+    def choose_moves(self):
+        # Most organisms can go any way; only those on a border class with
+        # fewer open directions (the edges of a bounded grid) redraw from
+        # their class's row of the move table.
+        table = self.move_table
+        direction = self.rng.integers(0, len(table.offsets), size=self.size)
+        if table.unrestricted.all():
+            return direction
+        border = table.border(self.x, self.y)
+        edge = np.flatnonzero(~table.unrestricted[border])
+        border = border[edge]
+        pick = (self.rng.random(len(edge)) * table.counts[border]).astype(np.int64)
+        direction[edge] = table.moves[border, pick]
+        return direction
+
+    def step(self, den):
+        step = self.step_count + 1
+        if self.resources is None:
+            resources = self.scatter_resources(den)
+        else:
+            self.regrow(step)
+        family_count = len(self.families)
+        events = self.events
+
+        self.strength -= 1
+        dead = self.strength <= 0
+        if events is not None:
+            events.emit_many(step, "death", self.labels(self.family[dead]), self.x[dead], self.y[dead], self.strength[dead])
+        decayed = int(np.count_nonzero(dead))
+        self._keep(~dead)
+        self.stats[:, STEPS] += np.bincount(self.family, minlength=family_count)
+
+        # Every organism picks a neighbouring cell. Per target cell, only the
+        # strongest mover (ties broken by direction) claims it; if the cell
+        # was occupied at the start of the step the claimant interacts with
+        # the occupant, otherwise it simply moves in. Everything is judged
+        # against the same snapshot, so the outcome does not depend on the
+        # order of the population arrays.
+        direction = self.choose_moves()
+        target_x, target_y = self.move_table.targets(self.x, self.y, direction)
+        target = target_x * self.height + target_y
+        count = len(self.move_table.offsets)
+        priority = self.strength * count + (count - direction)
+        best = np.zeros(self.width * self.height, dtype=np.int64)
+        np.maximum.at(best, target, priority)
+        claimant = np.flatnonzero(best[target] == priority)
+        defender = self.occupant[target[claimant]]
+        contested = defender >= 0
+
+        attacker = claimant[contested]
+        defender = defender[contested]
+        resource_value = self.rng.integers(1, MAX_RESOURCE + 1, size=len(attacker))
+        fight, winner, loser, attacker_delta, defender_delta = resolve_interactions(
+            self.outcomes, self.family, self.strength, attacker, defender, resource_value
+        )
+        cooperate = ~fight
+        collisions, fights = len(attacker), int(np.count_nonzero(fight))
+
+        # An organism can be both a claimant and the occupant of another
+        # claimed cell; its two deltas add up and are capped again below.
+        gain = np.zeros(self.size, dtype=np.int64)
+        np.add.at(gain, attacker, attacker_delta)
+        np.add.at(gain, defender, defender_delta)
+        self.stats[:, FIGHTS] += np.bincount(self.family[winner[fight]], minlength=family_count)
+        self.stats[:, COOPERATIONS] += np.bincount(self.family[attacker[cooperate]], minlength=family_count)
+        self.stats[:, COOPERATIONS] += np.bincount(self.family[defender[cooperate]], minlength=family_count)
+
+        moving = np.concatenate([claimant[~contested], attacker[fight & (winner == attacker)]])
+        alive = np.ones(self.size, dtype=bool)
+        alive[loser[fight]] = False
+        # An organism can lose a fight as claimant and another as occupant.
+        killed = self.size - int(np.count_nonzero(alive))
+        strength = np.minimum(self.strength + gain, MAX_STRENGTH)
+
+        if events is not None:
+            winner, loser = winner[fight], loser[fight]
+            fight_x, fight_y = target_x[attacker[fight]], target_y[attacker[fight]]
+            events.emit_many(
+                step, "fight", self.labels(self.family[winner]), fight_x, fight_y, strength[winner],
+                self.labels(self.family[loser]), strength[loser], resource_value[fight],
+            )
+            events.emit_many(step, "death", self.labels(self.family[loser]), self.x[loser], self.y[loser], strength[loser])
+            attacker, defender = attacker[cooperate], defender[cooperate]
+            events.emit_many(
+                step, "cooperate", self.labels(self.family[attacker]), target_x[attacker], target_y[attacker],
+                strength[attacker], self.labels(self.family[defender]), strength[defender], resource_value[cooperate],
+            )
+
+        self.occupant[self.cells()] = -1
+        self.x[moving] = target_x[moving]
+        self.y[moving] = target_y[moving]
+        self.strength = strength
+        self._compact(alive)
+        self.occupant[self.cells()] = np.arange(self.size)
+
+        parents = np.flatnonzero(self.strength >= REPRODUCTION_STRENGTH)
+        if len(parents):
+            free = np.flatnonzero(self.occupant < 0)
+            if len(parents) > len(free):
+                parents = np.sort(self.rng.choice(parents, size=len(free), replace=False))
+            spots = self.rng.choice(free, size=len(parents), replace=False)
+            self.strength[parents] = OFFSPRING_STRENGTH
+        self.counts = {
+            "collisions": collisions,
+            "fights": fights,
+            "cooperations": collisions - fights,
+            "births": len(parents),
+            "deaths": decayed + killed,
+            "placement_retries": 0,
+        }
+
+        found = resources[self.cells()] if self.resources is None else self.eat(self.cells(), step)
+        self.strength = np.minimum(self.strength + found, MAX_STRENGTH)
+        if events is not None:
+            eaten = found > 0
+            events.emit_many(
+                step, "consume", self.labels(self.family[eaten]), self.x[eaten], self.y[eaten],
+                self.strength[eaten], resource=found[eaten],
+            )
+
+        if len(parents):
+            start = self.size
+            self.x = np.concatenate([self.x, spots // self.height])
+            self.y = np.concatenate([self.y, spots % self.height])
+            self.family = np.concatenate([self.family, self.family[parents]])
+            self.strength = np.concatenate([self.strength, np.full(len(parents), OFFSPRING_STRENGTH)])
+            self.occupant[spots] = np.arange(start, self.size)
+            if events is not None:
+                born = slice(start, self.size)
+                events.emit_many(step, "birth", self.labels(self.family[born]), self.x[born], self.y[born], self.strength[born])
+
+        self.step_count += 1
+
+    def run(self, steps, den):
+        for _ in range(steps):
+            if self.full:
+                break
+            self.step(den)
+        return self.family_stats()
+
+    def _compact(self, keep):
+        self.x = self.x[keep]
+        self.y = self.y[keep]
+        self.family = self.family[keep]
+        self.strength = self.strength[keep]
+
+    def _keep(self, keep):
+        if keep.all():
+            return
+        self.occupant[self.cells()[~keep]] = -1
+        self._compact(keep)
+        self.occupant[self.cells()] = np.arange(self.size)
@@ -0,0 +1,262 @@
+import numpy as np
+
+from engine import (
+    COOPERATIONS, FAMILIES, FIGHTS, MAX_RESOURCE, MAX_STRENGTH, OFFSPRING_STRENGTH, REPRODUCTION_STRENGTH, STEPS,
+    resolve_interactions,
+)
+from outcomes import DEFAULT_OUTCOMES
+from sim import replicate_seed
+from topology import MoveTable
+
+# What a random number is drawn for. Placement uses PLACE + attempt, so the
+# codes after it are taken.
+MOVE, FIGHT, RESOURCE, AMOUNT, PLACE = range(5)
+PURPOSES = 64
+PLACEMENT_ATTEMPTS = 16
+
+GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+
+
+def mix(z):
+    # splitmix64's finaliser, on uint64 arrays (which wrap silently).
+    z = z ^ (z >> np.uint64(30))
+    z = z * np.uint64(0xBF58476D1CE4E5B9)
+    z = z ^ (z >> np.uint64(27))
+    z = z * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+def uniform(z):
+    return (z >> np.uint64(11)).astype(np.float64) * (1.0 / (1 << 53))
+
+
+def seed_key(seed):
+    if not hasattr(seed, "generate_state"):
+        seed = np.random.SeedSequence(seed)
+    return seed.generate_state(1, dtype=np.uint64)[0]
+
+
+class EnsembleWorld:
+    # Many independent ArrayWorld-style grids stepped together. Organisms of
+    # every replicate share one set of arrays (with a `replicate` column) and
+    # cells are numbered replicate * width * height + x * height + y, so a
+    # step is the same handful of array operations whatever the number of
+    # replicates.
+    #
+    # The rules are ArrayWorld's. The random numbers are not drawn from a
+    # shared generator, but hashed from the replicate's key, the step, what
+    # the number is for, and the cell involved. A replicate's run therefore
+    # depends only on its own seed, and not on which other replicates share
+    # the batch or how many there are. As with the sparse grid, each cell
+    # holds a resource with probability den / (width * height), so the number
+    # of resources varies around den from step to step.
+    #
+    # A replicate stops once its grid is full, as Simulation.run does; its
+    # organisms are then dropped and only its stats and step count are kept.
+    def __init__(self, width, height, den, seeds, families=FAMILIES, topology="bounded", neighbourhood="von-neumann"):
+        if width * height < 2:
+            raise ValueError("the grid needs at least two cells")
+        self.width = width
+        self.height = height
+        self.area = width * height
+        self.den = den
+        self.density = min(den, self.area) / self.area
+        self.families = list(families)
+        self.keys = np.array([seed_key(seed) for seed in seeds], dtype=np.uint64)
+        self.replicates = len(self.keys)
+        self.move_table = MoveTable(width, height, topology, neighbourhood)
+        self.occupant = np.full(self.replicates * self.area, -1, dtype=np.int64)
+        self.best = np.zeros(self.replicates * self.area, dtype=np.int64)
+        self.x = np.empty(0, dtype=np.int64)
+        self.y = np.empty(0, dtype=np.int64)
+        self.family = np.empty(0, dtype=np.int64)
+        self.strength = np.empty(0, dtype=np.int64)
+        self.replicate = np.empty(0, dtype=np.int64)
+        self.stats = np.zeros((self.replicates, len(self.families), 3), dtype=np.int64)
+        self.active = np.ones(self.replicates, dtype=bool)
+        self.steps_run = np.zeros(self.replicates, dtype=np.int64)
+        self.step_count = 0
+
+    @classmethod
+    def from_seed(cls, width, height, den, seed, replicates, first=0, **options):
+        # Replicate i gets replicate_seed(seed, i), the stream sweep.py and
+        # sim.py --replicate use.
+        seeds = [replicate_seed(seed, replicate) for replicate in range(first, first + replicates)]
+        return cls(width, height, den, seeds, **options)
+
+    @property
+    def size(self):
+        return len(self.x)
+
+    def cells(self):
+        return self.replicate * self.area + self.x * self.height + self.y
+
+    def populations(self):
+        # Replicates that filled their grid were dropped at a full population.
+        counts = np.bincount(self.replicate, minlength=self.replicates)
+        counts[~self.active] = self.area
+        return counts
+
+    def full(self):
+        return ~self.active
+
+    def family_stats(self, replicate):
+        return {
+            label: {"steps": int(row[STEPS]), "fights": int(row[FIGHTS]), "cooperations": int(row[COOPERATIONS])}
+            for label, row in zip(self.families, self.stats[replicate])
+            if row.any()
+        }
+
+    def draw(self, purpose, replicate, salt):
+        counter = np.array([self.step_count * PURPOSES + purpose], dtype=np.uint64)
+        base = mix(self.keys ^ mix(counter))
+        return mix(base[replicate] + np.asarray(salt, dtype=np.uint64) * GOLDEN)
+
+    def place_initial(self, per_family=1, strength=5):
+        per_replicate = len(self.families) * per_family
+        replicate = np.repeat(np.arange(self.replicates), per_replicate)
+        family = np.tile(np.repeat(np.arange(len(self.families)), per_family), self.replicates)
+        spots = self._place(replicate, np.tile(np.arange(per_replicate), self.replicates))
+        placed = spots >= 0
+        self._append(spots[placed], family[placed], strength, replicate[placed])
+
+    def run(self, steps):
+        for _ in range(steps):
+            self.retire_full()
+            if not self.active.any():
+                break
+            self.step()
+
+    def step(self):
+        area, height = self.area, self.height
+        table = self.move_table
+        self.step_count += 1
+
+        self.strength -= 1
+        self._keep(self.strength > 0)
+        self.stats[:, :, STEPS] += self._per_family(self.replicate, self.family)
+
+        # Moves and claims follow ArrayWorld.step.
+        local = self.x * height + self.y
+        border = table.border(self.x, self.y)
+        pick = (uniform(self.draw(MOVE, self.replicate, local)) * table.counts[border]).astype(np.int64)
+        direction = table.moves[border, pick]
+        target_x, target_y = table.targets(self.x, self.y, direction)
+        target_local = target_x * height + target_y
+        target = self.replicate * area + target_local
+        count = len(table.offsets)
+        priority = self.strength * count + (count - direction)
+        np.maximum.at(self.best, target, priority)
+        claimant = np.flatnonzero(self.best[target] == priority)
+        self.best[target] = 0
+        defender = self.occupant[target[claimant]]
+        contested = defender >= 0
+
+        attacker = claimant[contested]
+        defender = defender[contested]
+        resource_value = self._amount(FIGHT, self.replicate[attacker], target_local[attacker])
+        fight, winner, loser, attacker_delta, defender_delta = resolve_interactions(
+            DEFAULT_OUTCOMES, self.family, self.strength, attacker, defender, resource_value
+        )
+        cooperate = ~fight
+
+        gain = np.zeros(self.size, dtype=np.int64)
+        np.add.at(gain, attacker, attacker_delta)
+        np.add.at(gain, defender, defender_delta)
+        fighters = winner[fight]
+        self.stats[:, :, FIGHTS] += self._per_family(self.replicate[fighters], self.family[fighters])
+        for side in (attacker[cooperate], defender[cooperate]):
+            self.stats[:, :, COOPERATIONS] += self._per_family(self.replicate[side], self.family[side])
+
+        moving = np.concatenate([claimant[~contested], attacker[fight & (winner == attacker)]])
+        alive = np.ones(self.size, dtype=bool)
+        alive[loser[fight]] = False
+        self.occupant[self.cells()] = -1
+        self.x[moving] = target_x[moving]
+        self.y[moving] = target_y[moving]
+        self.strength = np.minimum(self.strength + gain, MAX_STRENGTH)
+        self._compact(alive)
+        self.occupant[self.cells()] = np.arange(self.size)
+
+        parents = np.flatnonzero(self.strength >= REPRODUCTION_STRENGTH)
+        spots = self._place(self.replicate[parents], self.x[parents] * height + self.y[parents])
+        parents, spots = parents[spots >= 0], spots[spots >= 0]
+        self.strength[parents] = OFFSPRING_STRENGTH
+
+        local = self.x * height + self.y
+        present = uniform(self.draw(RESOURCE, self.replicate, local)) < self.density
+        found = np.where(present, self._amount(AMOUNT, self.replicate, local), 0)
+        self.strength = np.minimum(self.strength + found, MAX_STRENGTH)
+
+        self._append(spots, self.family[parents], OFFSPRING_STRENGTH, self.replicate[parents])
+        self.steps_run[self.active] += 1
+
+    def _amount(self, purpose, replicate, salt):
+        return (self.draw(purpose, replicate, salt) % np.uint64(MAX_RESOURCE)).astype(np.int64) + 1
+
+    def _per_family(self, replicate, family):
+        family_count = len(self.families)
+        counts = np.bincount(replicate * family_count + family, minlength=self.replicates * family_count)
+        return counts.reshape(self.replicates, family_count)
+
+    def _place(self, replicate, salt):
+        # A free cell of its own replicate for each item (-1 where the grid has
+        # no room left). Items draw cells at random; a cell that is taken, or
+        # that an earlier item drew in the same attempt, means another
+        # attempt. The few items still without a cell after that take the
+        # replicate's remaining free cells in a random order. Chosen cells are
+        # marked -2 in occupant until the caller fills them.
+        area = self.area
+        spots = np.full(len(replicate), -1, dtype=np.int64)
+        pending = np.arange(len(replicate))
+        for attempt in range(PLACEMENT_ATTEMPTS):
+            if not len(pending):
+                return spots
+            cell = (uniform(self.draw(PLACE + attempt, replicate[pending], salt[pending])) * area).astype(np.int64)
+            candidate = replicate[pending] * area + cell
+            free = np.flatnonzero(self.occupant[candidate] == -1)
+            _, first = np.unique(candidate[free], return_index=True)
+            chosen = free[np.sort(first)]
+            spots[pending[chosen]] = candidate[chosen]
+            self.occupant[candidate[chosen]] = -2
+            pending = np.delete(pending, chosen)
+        for r in np.unique(replicate[pending]).tolist():
+            items = pending[replicate[pending] == r]
+            free = np.flatnonzero(self.occupant[r * area:(r + 1) * area] == -1)
+            order = np.argsort(self.draw(PLACE + PLACEMENT_ATTEMPTS, np.full(len(free), r), free), kind="stable")
+            taken = min(len(items), len(free))
+            spots[items[:taken]] = r * area + free[order[:taken]]
+            self.occupant[spots[items[:taken]]] = -2
+        return spots
+
+    def _append(self, spots, family, strength, replicate):
+        start = self.size
+        local = spots % self.area
+        self.x = np.concatenate([self.x, local // self.height])
+        self.y = np.concatenate([self.y, local % self.height])
+        self.family = np.concatenate([self.family, family])
+        self.strength = np.concatenate([self.strength, np.broadcast_to(strength, len(spots))])
+        self.replicate = np.concatenate([self.replicate, replicate])
+        self.occupant[spots] = np.arange(start, self.size)
+
+    def retire_full(self):
+        # Stops the replicates whose grid is full; run() does this before
+        # every step.
+        full = self.active & (np.bincount(self.replicate, minlength=self.replicates) >= self.area)
+        if full.any():
+            self.active[full] = False
+            self._keep(~full[self.replicate])
+
+    def _compact(self, keep):
+        self.x = self.x[keep]
+        self.y = self.y[keep]
+        self.family = self.family[keep]
+        self.strength = self.strength[keep]
+        self.replicate = self.replicate[keep]
+
+    def _keep(self, keep):
+        if keep.all():
+            return
+        self.occupant[self.cells()[~keep]] = -1
+        self._compact(keep)
+        self.occupant[self.cells()] = np.arange(self.size)
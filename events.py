@@ -0,0 +1,163 @@
+import csv
+import os
+
+import numpy as np
+
+KINDS = ("birth", "death", "fight", "cooperate", "consume")
+FIELDS = ("step", "kind", "family", "other_family", "x", "y", "strength", "other_strength", "resource")
+DTYPES = {
+    "step": np.int64,
+    "kind": str,
+    "family": str,
+    "other_family": str,
+    "x": np.int64,
+    "y": np.int64,
+    "strength": np.int64,
+    "other_strength": np.int64,
+    "resource": np.int64,
+}
+
+# Events are records with the fields above. `family` is the organism the
+# event is about (the winner of a fight, the mover in a cooperation, the
+# parent's family for a birth); `other_family`/`other_strength` describe the
+# second organism of a fight or cooperation and are "" / -1 otherwise.
+
+
+class EventBuffer:
+    # Collects events for one subscriber and hands them to its writer as
+    # column arrays of about chunk_size rows.
+    def __init__(self, writer, kinds=None, chunk_size=65536):
+        self.writer = writer
+        self.kinds = frozenset(kinds) if kinds is not None else frozenset(KINDS)
+        self.chunk_size = chunk_size
+        self.rows = []
+        self.batches = []
+        self.pending = 0
+
+    def add(self, row):
+        self.rows.append(row)
+        self.pending += 1
+        if self.pending >= self.chunk_size:
+            self.flush()
+
+    def add_batch(self, columns, count):
+        if self.rows:
+            self.batches.append(self._row_columns())
+            self.rows = []
+        self.batches.append(columns)
+        self.pending += count
+        if self.pending >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        parts = self.batches
+        if self.rows:
+            parts.append(self._row_columns())
+        self.writer.write({field: np.concatenate([part[field] for part in parts]) for field in FIELDS})
+        self.rows = []
+        self.batches = []
+        self.pending = 0
+
+    def _row_columns(self):
+        return {field: np.array(values, dtype=DTYPES[field]) for field, values in zip(FIELDS, zip(*self.rows))}
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+
+class EventStream:
+    def __init__(self):
+        self.buffers = []
+        self.wanted = frozenset()
+
+    def subscribe(self, writer, kinds=None, chunk_size=65536):
+        buffer = EventBuffer(writer, kinds, chunk_size)
+        self.buffers.append(buffer)
+        self.wanted = self.wanted | buffer.kinds
+        return buffer
+
+    def emit(self, step, kind, family, x, y, strength, other_family="", other_strength=-1, resource=0):
+        row = (step, kind, family, other_family, x, y, strength, other_strength, resource)
+        for buffer in self.buffers:
+            if kind in buffer.kinds:
+                buffer.add(row)
+
+    def emit_many(self, step, kind, family, x, y, strength, other_family=None, other_strength=None, resource=None):
+        count = len(family)
+        if not count or kind not in self.wanted:
+            return
+        columns = {
+            "step": np.full(count, step, dtype=np.int64),
+            "kind": np.full(count, kind),
+            "family": np.asarray(family).astype(str),
+            "other_family": np.full(count, "") if other_family is None else np.asarray(other_family).astype(str),
+            "x": np.asarray(x, dtype=np.int64),
+            "y": np.asarray(y, dtype=np.int64),
+            "strength": np.asarray(strength, dtype=np.int64),
+            "other_strength": np.full(count, -1, dtype=np.int64) if other_strength is None else np.asarray(other_strength, dtype=np.int64),
+            "resource": np.zeros(count, dtype=np.int64) if resource is None else np.asarray(resource, dtype=np.int64),
+        }
+        for buffer in self.buffers:
+            if kind in buffer.kinds:
+                buffer.add_batch(columns, count)
+
+    def flush(self):
+        for buffer in self.buffers:
+            buffer.flush()
+
+    def close(self):
+        for buffer in self.buffers:
+            buffer.close()
+
+
+class CsvWriter:
+    def __init__(self, path):
+        self.out = open(path, "w", newline="")
+        self.writer = csv.writer(self.out)
+        self.writer.writerow(FIELDS)
+
+    def write(self, columns):
+        self.writer.writerows(zip(*(columns[field].tolist() for field in FIELDS)))
+
+    def close(self):
+        self.out.close()
+
+
+class NpzChunkWriter:
+    # One events-NNNNNN.npz file of column arrays per flushed chunk.
+    def __init__(self, directory):
+        self.directory = directory
+        self.chunks = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, columns):
+        np.savez(os.path.join(self.directory, f"events-{self.chunks:06d}.npz"), **columns)
+        self.chunks += 1
+
+    def close(self):
+        pass
+
+
+class MemoryWriter:
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, columns):
+        self.chunks.append(columns)
+
+    def columns(self):
+        if not self.chunks:
+            return {field: np.empty(0, dtype=DTYPES[field]) for field in FIELDS}
+        return {field: np.concatenate([chunk[field] for chunk in self.chunks]) for field in FIELDS}
+
+    def close(self):
+        pass
+
+
+def open_writer(path):
+    if path.endswith(".csv"):
+        return CsvWriter(path)
+    return NpzChunkWriter(path)
@@ -0,0 +1,116 @@
+from string import ascii_uppercase
+
+FAMILIES = ["A", "B", "C", "D", "E"]
+COLUMNS = ("population", "strength", "births", "deaths", "fights", "cooperations", "steps")
+
+
+def family_labels(count):
+    # "A".."Z", then "AA", "AB", ... as spreadsheet columns are named.
+    labels = []
+    for index in range(count):
+        label = ""
+        index += 1
+        while index:
+            index, letter = divmod(index - 1, 26)
+            label = ascii_uppercase[letter] + label
+        labels.append(label)
+    return labels
+
+
+def padded_labels(labels):
+    # labels padded to the widest one, and an empty-cell marker of the same
+    # width, so grid columns line up once labels reach two letters.
+    width = max(map(len, labels), default=1)
+    return [label.ljust(width) for label in labels], ".".ljust(width)
+
+
+class FamilyTable:
+    # Live counters per family, one list per column indexed by the integer
+    # family id (the index into labels), so recording an event is a single
+    # list update whatever the number of families. population and strength
+    # are the organisms in Simulation.organisms and their total strength;
+    # births, deaths, fights (won), cooperations and steps (organism-steps
+    # survived) are running totals.
+    def __init__(self, labels):
+        self.labels = list(labels)
+        count = len(self.labels)
+        self.population = [0] * count
+        self.strength = [0] * count
+        self.births = [0] * count
+        self.deaths = [0] * count
+        self.fights = [0] * count
+        self.cooperations = [0] * count
+        self.steps = [0] * count
+
+    def __len__(self):
+        return len(self.labels)
+
+    def columns(self):
+        return [getattr(self, column) for column in COLUMNS]
+
+    def add_family(self, label):
+        self.labels.append(label)
+        for column in self.columns():
+            column.append(0)
+        return len(self.labels) - 1
+
+    def count(self, organisms):
+        # Sets population and strength from scratch.
+        population = [0] * len(self)
+        strength = [0] * len(self)
+        for organism in organisms:
+            population[organism.family] += 1
+            strength[organism.family] += organism.strength
+        self.population = population
+        self.strength = strength
+
+    def family_stats(self):
+        # The end-of-run summary in the original format, keyed by label, for
+        # the families that have been alive for at least one step.
+        return {
+            label: {"steps": steps, "fights": fights, "cooperations": cooperations}
+            for label, steps, fights, cooperations in zip(self.labels, self.steps, self.fights, self.cooperations)
+            if steps or fights or cooperations
+        }
+
+
+class FamilySeries:
+    # Every column of a FamilyTable recorded after each step into one
+    # preallocated (steps, column, family) array, which doubles in length if
+    # the run goes on longer than `capacity` steps.
+    def __init__(self, table, capacity=1024):
+        import numpy as np
+
+        self.table = table
+        self.data = np.zeros((max(capacity, 1), len(COLUMNS), len(table)), dtype=np.int64)
+        self.step = np.zeros(len(self.data), dtype=np.int64)
+        self.length = 0
+
+    def record(self, step):
+        import numpy as np
+
+        if self.length == len(self.data):
+            self.data = np.concatenate([self.data, np.zeros_like(self.data)])
+            self.step = np.concatenate([self.step, np.zeros_like(self.step)])
+        families = len(self.table)
+        if families > self.data.shape[2]:
+            extra = np.zeros((len(self.data), len(COLUMNS), families - self.data.shape[2]), dtype=np.int64)
+            self.data = np.concatenate([self.data, extra], axis=2)
+        self.data[self.length, :, :families] = self.table.columns()
+        self.step[self.length] = step
+        self.length += 1
+
+    def column(self, name):
+        # A (steps recorded, families) array of one column.
+        return self.data[:self.length, COLUMNS.index(name)]
+
+    def steps(self):
+        return self.step[:self.length]
+
+    def save(self, path):
+        # An .npz with the recorded steps, the family labels and one
+        # (steps, families) array per column.
+        import numpy as np
+
+        columns = {column: self.column(column) for column in COLUMNS}
+        np.savez(path, step=self.steps(), labels=np.array(self.table.labels), **columns)
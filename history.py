@@ -0,0 +1,378 @@
+import argparse
+import json
+import mmap
+import struct
+import zlib
+from bisect import bisect_right
+
+import numpy as np
+
+from families import padded_labels
+from outcomes import MAX_STRENGTH
+
+# A history file is HEADER, the family labels as JSON (`labels` bytes), then
+# one record per step: RECORD followed by `length` bytes of zlib-compressed
+# payload. Cells are numbered x * height + y and hold a code: 0 for an empty
+# cell, otherwise 1 + family * (MAX_STRENGTH + 1) + strength (the numbering
+# of images.colour_table), as unsigned integers of `code_size` bytes.
+#   KEYFRAME  every cell's code.
+#   DELTA     the cells that changed since the previous step: the gaps
+#             between their (ascending) numbers as unsigned integers of
+#             `gap_size` bytes, then old - new for each (modulo the code
+#             size). Subtracting it steps forward and adding it steps back,
+#             and the common changes (every organism losing a point of
+#             strength, gaps of 1 across a crowded area) compress to almost
+#             nothing. An organism that died leaves a cell that turned empty,
+#             a birth a cell that filled, and a move both.
+# Every step has a DELTA except the first, and every `keyframe_every` steps
+# there is also a KEYFRAME. close() appends an INDEX record (the offsets of
+# every delta and keyframe) and FOOTER pointing at it; a file without one
+# (a run that was cut short) is indexed by walking the records.
+MAGIC = b"LSHS"
+VERSION = 1
+HEADER = struct.Struct("<4sIIIIBI")
+RECORD = struct.Struct("<BQIBI")
+FOOTER = struct.Struct("<Q4s")
+KEYFRAME, DELTA, INDEX = 1, 2, 3
+
+
+def code_type(families):
+    codes = families * (MAX_STRENGTH + 1) + 1
+    return np.dtype(np.uint8 if codes <= 2**8 else np.uint16 if codes <= 2**16 else np.uint32)
+
+
+def gap_type(largest):
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if largest <= np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.uint64)
+
+
+def decode(codes):
+    # Family id (-1 for an empty cell) and strength arrays for an array of codes.
+    codes = codes.astype(np.int64) - 1
+    family, strength = np.divmod(codes, MAX_STRENGTH + 1)
+    family[codes < 0] = -1
+    strength[codes < 0] = 0
+    return family, strength
+
+
+class HistoryRecorder:
+    # Observer that appends every step to a history file. The delta is found
+    # from the cells occupied before and after the step, so recording costs
+    # time in proportion to the population rather than the area, apart from
+    # a keyframe every `keyframe_every` steps.
+    def __init__(self, path, keyframe_every=1000, level=1):
+        self.path = path
+        self.keyframe_every = keyframe_every
+        self.level = level
+        self.out = None
+
+    def start(self, simulation):
+        self.width = simulation.width
+        self.height = simulation.height
+        self.code = code_type(len(simulation.families))
+        self.first_step = simulation.step_count
+        self.deltas = []
+        self.keyframes = []
+        self.out = open(self.path, "wb")
+        labels = json.dumps(list(simulation.families)).encode()
+        self.out.write(HEADER.pack(MAGIC, VERSION, self.width, self.height, self.keyframe_every, self.code.itemsize, len(labels)))
+        self.out.write(labels)
+        self.state = np.zeros(self.width * self.height, dtype=self.code)
+        self.cells = np.empty(0, dtype=np.int64)
+        self._update(simulation)
+        self._write_keyframe(simulation.step_count)
+
+    def __call__(self, simulation):
+        if self.out is None:
+            self.start(simulation)
+            return
+        step = simulation.step_count
+        state = self.state
+        previous = self.cells
+        cells, codes = self._occupied(simulation)
+        touched = np.concatenate([previous, cells])
+        old = state[touched]
+        state[previous] = 0
+        state[cells] = codes
+        self.cells = cells
+        new = state[touched]
+        changed = old != new
+        touched, old, new = touched[changed], old[changed], new[changed]
+        # A cell can be listed twice (occupied before and after); both
+        # entries hold the same old and new code.
+        order = np.argsort(touched, kind="stable")
+        touched, old, new = touched[order], old[order], new[order]
+        first = np.ones(len(touched), dtype=bool)
+        first[1:] = touched[1:] != touched[:-1]
+        touched, old, new = touched[first], old[first], new[first]
+        gaps = np.diff(touched, prepend=0)
+        gap = gap_type(gaps.max() if len(gaps) else 0)
+        payload = gaps.astype(gap).tobytes() + (old - new).tobytes()
+        self.deltas.append(self._write(DELTA, step, len(touched), gap.itemsize, payload))
+        if (step - self.first_step) % self.keyframe_every == 0:
+            self._write_keyframe(step)
+
+    def _occupied(self, simulation):
+        x, y, family, strength = simulation.organism_arrays()
+        codes = 1 + np.asarray(family) * (MAX_STRENGTH + 1) + np.clip(strength, 0, MAX_STRENGTH)
+        return np.asarray(x) * self.height + np.asarray(y), codes.astype(self.code)
+
+    def _update(self, simulation):
+        self.cells, codes = self._occupied(simulation)
+        self.state[self.cells] = codes
+
+    def _write_keyframe(self, step):
+        self.keyframes.append((step, self._write(KEYFRAME, step, len(self.state), 0, self.state.tobytes())))
+
+    def _write(self, kind, step, count, gap_size, payload):
+        offset = self.out.tell()
+        payload = zlib.compress(payload, self.level)
+        self.out.write(RECORD.pack(kind, step, count, gap_size, len(payload)))
+        self.out.write(payload)
+        return offset
+
+    def close(self):
+        if self.out is None:
+            return
+        keyframes = np.array(self.keyframes, dtype=np.int64).reshape(-1, 2)
+        payload = (
+            struct.pack("<QQ", len(self.deltas), len(keyframes))
+            + np.array(self.deltas, dtype=np.int64).tobytes()
+            + keyframes.tobytes()
+        )
+        index = self._write(INDEX, self.first_step, 0, 0, payload)
+        self.out.write(FOOTER.pack(index, MAGIC))
+        self.out.close()
+        self.out = None
+
+
+class History:
+    # Read access to a history file through a memory map. state(step) starts
+    # from the nearest keyframe at or before the step, so it decodes at most
+    # one keyframe and keyframe_every - 1 deltas wherever the step is.
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.width, self.height, self.keyframe_every, code_size, labels = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a history file")
+        if version != VERSION:
+            raise ValueError(f"unsupported history version {version}")
+        self.code = np.dtype(f"u{code_size}")
+        self.families = json.loads(self.map[HEADER.size:HEADER.size + labels])
+        self.start = HEADER.size + labels
+        self._index()
+
+    def _index(self):
+        index = None
+        if len(self.map) >= FOOTER.size:
+            index, magic = FOOTER.unpack_from(self.map, len(self.map) - FOOTER.size)
+            if magic != MAGIC:
+                index = None
+        if index is not None:
+            kind, self.first_step, _, _, _ = RECORD.unpack_from(self.map, index)
+            payload = self._payload(index)
+            deltas, keyframes = struct.unpack_from("<QQ", payload)
+            offsets = np.frombuffer(payload, dtype=np.int64, offset=16)
+            self.deltas = offsets[:deltas]
+            keyframes = offsets[deltas:deltas + 2 * keyframes].reshape(-1, 2)
+        else:
+            self.first_step, self.deltas, keyframes = self._walk()
+        self.keyframe_steps = keyframes[:, 0].tolist()
+        self.keyframe_offsets = keyframes[:, 1].tolist()
+
+    def _walk(self):
+        # Offsets of the complete records, for a file that was not closed.
+        deltas = []
+        keyframes = []
+        first_step = None
+        offset = self.start
+        while offset + RECORD.size <= len(self.map):
+            kind, step, _, _, length = RECORD.unpack_from(self.map, offset)
+            if offset + RECORD.size + length > len(self.map):
+                break
+            if kind == KEYFRAME:
+                keyframes.append((step, offset))
+                if first_step is None:
+                    first_step = step
+            elif kind == DELTA:
+                deltas.append(offset)
+            offset += RECORD.size + length
+        if first_step is None:
+            raise ValueError("the history has no keyframe")
+        # Keep only the steps that have both their delta and, when one is
+        # due, their keyframe.
+        last = first_step + len(deltas)
+        keyframes = [keyframe for keyframe in keyframes if keyframe[0] <= last]
+        return first_step, np.array(deltas, dtype=np.int64), np.array(keyframes, dtype=np.int64).reshape(-1, 2)
+
+    @property
+    def last_step(self):
+        return self.first_step + len(self.deltas)
+
+    def __len__(self):
+        return len(self.deltas) + 1
+
+    def _payload(self, offset):
+        length = RECORD.unpack_from(self.map, offset)[4]
+        start = offset + RECORD.size
+        return zlib.decompress(self.map[start:start + length])
+
+    def keyframe(self, step):
+        # The last keyframe at or before step, as (step, codes).
+        if not self.first_step <= step <= self.last_step:
+            raise IndexError(f"step {step} is outside the history ({self.first_step}..{self.last_step})")
+        which = bisect_right(self.keyframe_steps, step) - 1
+        codes = np.frombuffer(self._payload(self.keyframe_offsets[which]), dtype=self.code).copy()
+        return self.keyframe_steps[which], codes
+
+    def delta(self, step):
+        # The change from step - 1 to step, as cell numbers and old - new
+        # codes.
+        offset = int(self.deltas[step - self.first_step - 1])
+        _, _, count, gap_size, _ = RECORD.unpack_from(self.map, offset)
+        payload = self._payload(offset)
+        gaps = np.frombuffer(payload, dtype=f"u{gap_size}", count=count) if count else np.empty(0, dtype=np.int64)
+        cells = np.cumsum(gaps, dtype=np.int64)
+        return cells, np.frombuffer(payload, dtype=self.code, count=count, offset=count * gap_size)
+
+    def state(self, step):
+        step_at, codes = self.keyframe(step)
+        while step_at < step:
+            step_at += 1
+            cells, change = self.delta(step_at)
+            codes[cells] -= change
+        return codes
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+
+class Replay:
+    # A cursor over a History: seek() to any step, then forward() and back()
+    # one step at a time by applying a delta.
+    def __init__(self, history):
+        self.history = history
+        self.step = history.first_step
+        self.codes = history.state(self.step)
+
+    def seek(self, step):
+        history = self.history
+        if not history.first_step <= step <= history.last_step:
+            raise IndexError(f"step {step} is outside the history ({history.first_step}..{history.last_step})")
+        keyframe = history.keyframe_steps[bisect_right(history.keyframe_steps, step) - 1]
+        if keyframe <= self.step <= step:
+            while self.step < step:
+                self.forward()
+        elif step < self.step and self.step - step <= step - keyframe:
+            while self.step > step:
+                self.back()
+        else:
+            self.codes = history.state(step)
+            self.step = step
+
+    def forward(self):
+        if self.step >= self.history.last_step:
+            return False
+        self.step += 1
+        cells, change = self.history.delta(self.step)
+        self.codes[cells] -= change
+        return True
+
+    def back(self):
+        if self.step <= self.history.first_step:
+            return False
+        cells, change = self.history.delta(self.step)
+        self.codes[cells] += change
+        self.step -= 1
+        return True
+
+    def grids(self):
+        # width x height family id (-1 for empty) and strength arrays.
+        family, strength = decode(self.codes)
+        shape = (self.history.width, self.history.height)
+        return family.reshape(shape), strength.reshape(shape)
+
+    def populations(self):
+        family, _ = decode(self.codes)
+        return np.bincount(family[family >= 0], minlength=len(self.history.families))
+
+    def show(self, grid=True):
+        history = self.history
+        labels = history.families
+        populations = self.populations()
+        print(f"step {self.step} ({history.first_step}..{history.last_step}), population {int(populations.sum())}")
+        print(" ".join(f"{labels[family]}:{count}" for family, count in enumerate(populations.tolist()) if count))
+        if grid:
+            family, _ = self.grids()
+            padded, empty = padded_labels(labels)
+            for row in family.T:
+                print(" ".join(padded[cell] if cell >= 0 else empty for cell in row.tolist()))
+            print("")
+
+    def save_image(self, path, scale=1):
+        from images import render, write_image
+
+        family, strength = decode(self.codes)
+        cells = np.flatnonzero(family >= 0)
+        x, y = np.divmod(cells, self.history.height)
+        image = render(self.history.width, self.history.height, x, y, family[cells], strength[cells], len(self.history.families), scale)
+        write_image(path, image)
+
+
+def browse(replay, grid):
+    # Commands: Enter or n (next step), p (previous step), a number (go to
+    # that step), q (quit).
+    replay.show(grid)
+    while True:
+        try:
+            command = input("[n]ext, [p]revious, step number or [q]uit: ").strip()
+        except EOFError:
+            return
+        if command in ("", "n"):
+            replay.forward()
+        elif command == "p":
+            replay.back()
+        elif command == "q":
+            return
+        elif command.lstrip("-").isdigit():
+            step = int(command)
+            if not replay.history.first_step <= step <= replay.history.last_step:
+                print(f"no step {step} in the history")
+                continue
+            replay.seek(step)
+        else:
+            continue
+        replay.show(grid)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a history recorded with sim.py --history.")
+    parser.add_argument("path", help="history file")
+    parser.add_argument("--step", type=int, help="show this step and exit instead of browsing")
+    parser.add_argument("--image", help="with --step, write the grid to this .png or .ppm path instead of printing it")
+    parser.add_argument("--image-scale", type=int, default=1, help="cells per image pixel along each side (default: 1)")
+    parser.add_argument("--no-grid", action="store_true", help="print only the step and family populations")
+    args = parser.parse_args(argv)
+    history = History(args.path)
+    try:
+        replay = Replay(history)
+        if args.step is None:
+            browse(replay, not args.no_grid)
+            return
+        if not history.first_step <= args.step <= history.last_step:
+            parser.error(f"the history covers steps {history.first_step}..{history.last_step}")
+        replay.seek(args.step)
+        if args.image:
+            replay.save_image(args.image, args.image_scale)
+        else:
+            replay.show(not args.no_grid)
+    finally:
+        history.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+import os
+import struct
+import zlib
+
+import numpy as np
+
+from engine import MAX_STRENGTH
+
+# The dimmest an organism is drawn, as a fraction of its family's colour; a
+# strength of MAX_STRENGTH gets the full colour.
+MIN_BRIGHTNESS = 0.3
+
+
+def palette(count, saturation=0.75):
+    # One colour per family as a (count, 3) array in 0..1. Hues are spread by
+    # the golden ratio, so neighbouring family ids get clearly different
+    # colours however many families there are.
+    hue = (np.arange(count) * 0.618033988749895) % 1.0
+    sector = (hue * 6).astype(np.int64)
+    fraction = hue * 6 - sector
+    high = np.ones(count)
+    low = np.full(count, 1 - saturation)
+    falling = 1 - saturation * fraction
+    rising = 1 - saturation * (1 - fraction)
+    sectors = np.stack([
+        np.stack([high, rising, low]), np.stack([falling, high, low]), np.stack([low, high, rising]),
+        np.stack([low, falling, high]), np.stack([rising, low, high]), np.stack([high, low, falling]),
+    ])
+    return sectors[sector, :, np.arange(count)]
+
+
+def colour_table(families):
+    # uint8 RGB for every (family, strength) pair, flattened so that row
+    # 1 + family * (MAX_STRENGTH + 1) + strength is that organism's colour
+    # and row 0 is an empty cell (black).
+    brightness = MIN_BRIGHTNESS + (1 - MIN_BRIGHTNESS) * np.arange(MAX_STRENGTH + 1) / MAX_STRENGTH
+    colours = palette(families)[:, None, :] * brightness[None, :, None] * 255
+    return np.vstack([np.zeros((1, 3)), colours.reshape(-1, 3)]).astype(np.uint8)
+
+
+def render(width, height, x, y, family, strength, families, scale=1):
+    # An (rows, columns, 3) uint8 image of the organisms given as arrays of
+    # x, y, family id and strength. Each scale x scale block of cells becomes
+    # one pixel showing its strongest organism (which of several equally
+    # strong ones is arbitrary). The work is a few array operations over the
+    # population, so it does not grow with the empty part of the world.
+    columns = -(-width // scale)
+    rows = -(-height // scale)
+    strength = np.clip(strength, 0, MAX_STRENGTH)
+    code = 1 + family * (MAX_STRENGTH + 1) + strength
+    pixel = (y // scale) * columns + x // scale
+    if scale > 1:
+        # Weakest first, so the strongest organism in a block is written last.
+        order = np.argsort(strength.astype(np.int8), kind="stable")
+        pixel, code = pixel[order], code[order]
+    colours = colour_table(families)
+    if rows * columns <= len(code):
+        # More organisms than pixels: look colours up once per pixel.
+        pixels = np.zeros(rows * columns, dtype=np.int32)
+        pixels[pixel] = code
+        return np.take(colours, pixels, axis=0).reshape(rows, columns, 3)
+    image = np.zeros((rows * columns, 3), dtype=np.uint8)
+    image[pixel] = np.take(colours, code, axis=0)
+    return image.reshape(rows, columns, 3)
+
+
+def write_ppm(path, image):
+    rows, columns, _ = image.shape
+    with open(path, "wb") as out:
+        out.write(b"P6\n%d %d\n255\n" % (columns, rows))
+        out.write(np.ascontiguousarray(image).tobytes())
+
+
+def png_chunk(kind, data):
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+
+def write_png(path, image, level=1):
+    # An 8-bit RGB PNG with no row filters, so encoding is one zlib pass.
+    rows, columns, _ = image.shape
+    scanlines = np.zeros((rows, columns * 3 + 1), dtype=np.uint8)
+    scanlines[:, 1:] = image.reshape(rows, columns * 3)
+    with open(path, "wb") as out:
+        out.write(b"\x89PNG\r\n\x1a\n")
+        out.write(png_chunk(b"IHDR", struct.pack(">IIBBBBB", columns, rows, 8, 2, 0, 0, 0)))
+        out.write(png_chunk(b"IDAT", zlib.compress(scanlines.tobytes(), level)))
+        out.write(png_chunk(b"IEND", b""))
+
+
+def write_image(path, image):
+    if os.path.splitext(path)[1].lower() == ".png":
+        write_png(path, image)
+    else:
+        write_ppm(path, image)
+
+
+def save(simulation, path, scale=1):
+    x, y, family, strength = simulation.organism_arrays()
+    image = render(simulation.width, simulation.height, x, y, family, strength, len(simulation.families), scale)
+    write_image(path, image)
+
+
+class ImageExporter:
+    # Observer that writes an image of the grid every `every` steps to path
+    # ({step} is replaced by the step). A .png path gives PNG files; anything
+    # else gives binary PPM, which needs no encoding at all.
+    def __init__(self, path, every, scale=1):
+        self.path = path
+        self.every = every
+        self.scale = scale
+        self.written = 0
+
+    def __call__(self, simulation):
+        if simulation.step_count % self.every:
+            return
+        save(simulation, self.path.format(step=simulation.step_count), self.scale)
+        self.written += 1
@@ -0,0 +1,149 @@
+import json
+import threading
+import time
+import tracemalloc
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PHASES = ("resources", "decay", "move", "interact", "reproduce", "consume", "step", "render", "observers")
+COUNTERS = ("collisions", "fights", "cooperations", "births", "deaths", "placement_retries")
+
+
+class Profiler:
+    # Per-phase wall time and event counters for each step, kept as a record
+    # per step (the last `history` are kept in memory, and all of them go to
+    # `out` as JSON lines when it is given). The object engine reports its
+    # phases separately; the other engines report their whole step as "step".
+    # Steps ended with counters=False (an engine that does not count events)
+    # carry no counters, and neither do the totals once such a step is seen.
+    # With memory=True, tracemalloc runs and every record carries the current
+    # and peak traced bytes; every `snapshot_every` steps it also carries the
+    # top allocation sites.
+    def __init__(self, out=None, memory=False, snapshot_every=0, history=1000, clock=time.perf_counter):
+        self.out = out
+        self.memory = memory
+        self.snapshot_every = snapshot_every
+        self.records = deque(maxlen=history)
+        self.clock = clock
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.phase_totals = dict.fromkeys(PHASES, 0.0)
+        self.counter_totals = dict.fromkeys(COUNTERS, 0)
+        self.last = None
+        self.started = None
+        self.latest = None
+        self.counted = True
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def begin_step(self):
+        self.started = self.last = self.clock()
+        if self.memory:
+            tracemalloc.reset_peak()
+
+    def lap(self, phase):
+        # Charges the time since the previous lap to phase.
+        now = self.clock()
+        self.phases[phase] += now - self.last
+        self.last = now
+
+    def add(self, phase, seconds):
+        self.phases[phase] += seconds
+
+    def end_step(self, simulation, counters=True):
+        seconds = self.clock() - self.started
+        record = {
+            "step": simulation.step_count,
+            "population": simulation.population(),
+            "seconds": seconds,
+            "phases": {phase: value for phase, value in self.phases.items() if value},
+        }
+        if counters:
+            record["counters"] = dict(self.counters)
+        else:
+            self.counted = False
+        if self.memory:
+            record["memory_current"], record["memory_peak"] = tracemalloc.get_traced_memory()
+            if self.snapshot_every and simulation.step_count % self.snapshot_every == 0:
+                statistics = tracemalloc.take_snapshot().statistics("lineno")[:5]
+                record["top_allocations"] = [
+                    {"where": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}", "bytes": stat.size}
+                    for stat in statistics
+                ]
+        for phase, value in self.phases.items():
+            self.phase_totals[phase] += value
+            self.phases[phase] = 0.0
+        for counter, value in self.counters.items():
+            self.counter_totals[counter] += value
+            self.counters[counter] = 0
+        self.records.append(record)
+        self.latest = record
+        if self.out is not None:
+            self.out.write(json.dumps(record) + "\n")
+        return record
+
+    def prometheus_text(self):
+        lines = [
+            "# TYPE lifesim_phase_seconds_total counter",
+            *(f'lifesim_phase_seconds_total{{phase="{phase}"}} {value}' for phase, value in self.phase_totals.items()),
+        ]
+        if self.counted:
+            lines += [
+                "# TYPE lifesim_events_total counter",
+                *(f'lifesim_events_total{{kind="{counter}"}} {value}' for counter, value in self.counter_totals.items()),
+            ]
+        latest = self.latest
+        if latest is not None:
+            lines += [
+                "# TYPE lifesim_step gauge",
+                f"lifesim_step {latest['step']}",
+                "# TYPE lifesim_population gauge",
+                f"lifesim_population {latest['population']}",
+                "# TYPE lifesim_step_seconds gauge",
+                f"lifesim_step_seconds {latest['seconds']}",
+            ]
+            if "memory_current" in latest:
+                lines += [
+                    "# TYPE lifesim_memory_bytes gauge",
+                    f'lifesim_memory_bytes{{kind="current"}} {latest["memory_current"]}',
+                    f'lifesim_memory_bytes{{kind="peak"}} {latest["memory_peak"]}',
+                ]
+        return "\n".join(lines) + "\n"
+
+    def close(self):
+        if self.out is not None:
+            self.out.close()
+        if self.memory:
+            tracemalloc.stop()
+
+
+class MetricsServer:
+    # Serves profiler.prometheus_text() at http://host:port/metrics from a
+    # daemon thread.
+    def __init__(self, profiler, port, host="127.0.0.1"):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = profiler.prometheus_text().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,87 @@
+MAX_STRENGTH = 10
+MAX_RESOURCE = 10
+
+
+def default_policy(same_family, attacker_strength, defender_strength, resource_value):
+    # Organism.interact_with followed by interact(). Returns (fight,
+    # attacker_wins, attacker_gain, defender_gain); the gains are what each
+    # side consumes, before strength is capped at MAX_STRENGTH.
+    half = resource_value // 2
+    attacker_stronger = attacker_strength > defender_strength
+    if same_family or half > (resource_value if attacker_stronger else 0):
+        return False, False, half, half
+    if attacker_stronger:
+        return True, True, resource_value, 0
+    return True, False, 0, resource_value
+
+
+class OutcomeTable:
+    # The outcome of every possible collision, worked out once from a policy
+    # (a function with default_policy's arguments and result). Strength is
+    # 0..MAX_STRENGTH and resources 1..MAX_RESOURCE, so the table has
+    # 2 x 11 x 11 x 11 entries, indexed by (same family, attacker strength,
+    # defender strength, resource value). Each entry holds (fight,
+    # attacker_wins, attacker_delta, defender_delta), where the deltas are
+    # the changes in strength after capping to 0..MAX_STRENGTH.
+    #
+    # outcome() looks up one collision (the object engine), gather() a batch
+    # of them as arrays (the array engine).
+    strengths = MAX_STRENGTH + 1
+    resources = MAX_RESOURCE + 1
+
+    def __init__(self, policy=default_policy):
+        self.policy = policy
+        self.entries = [
+            self._settle(same, attacker, defender, resource)
+            for same in (False, True)
+            for attacker in range(self.strengths)
+            for defender in range(self.strengths)
+            for resource in range(self.resources)
+        ]
+        self.arrays = None
+
+    def _settle(self, same_family, attacker_strength, defender_strength, resource_value):
+        fight, attacker_wins, attacker_gain, defender_gain = self.policy(
+            same_family, attacker_strength, defender_strength, resource_value
+        )
+        return (
+            bool(fight),
+            bool(attacker_wins),
+            max(0, min(attacker_strength + attacker_gain, MAX_STRENGTH)) - attacker_strength,
+            max(0, min(defender_strength + defender_gain, MAX_STRENGTH)) - defender_strength,
+        )
+
+    def index(self, same_family, attacker_strength, defender_strength, resource_value):
+        return ((same_family * self.strengths + attacker_strength) * self.strengths + defender_strength) * self.resources + resource_value
+
+    def outcome(self, same_family, attacker_strength, defender_strength, resource_value):
+        # Strengths outside the table (organisms created stronger than
+        # MAX_STRENGTH) go through the policy directly.
+        if attacker_strength <= MAX_STRENGTH and defender_strength <= MAX_STRENGTH:
+            return self.entries[self.index(same_family, attacker_strength, defender_strength, resource_value)]
+        return self._settle(same_family, attacker_strength, defender_strength, resource_value)
+
+    def gather(self, same_family, attacker_strength, defender_strength, resource_value):
+        # Arrays of fight, attacker_wins, attacker_delta and defender_delta
+        # for a batch of collisions, with one lookup per array. Strengths
+        # above MAX_STRENGTH are looked up as MAX_STRENGTH.
+        import numpy as np
+
+        if self.arrays is None:
+            fight, attacker_wins, attacker_delta, defender_delta = zip(*self.entries)
+            self.arrays = (
+                np.array(fight, dtype=bool),
+                np.array(attacker_wins, dtype=bool),
+                np.array(attacker_delta, dtype=np.int64),
+                np.array(defender_delta, dtype=np.int64),
+            )
+        index = self.index(
+            np.asarray(same_family, dtype=np.int64),
+            np.minimum(attacker_strength, MAX_STRENGTH),
+            np.minimum(defender_strength, MAX_STRENGTH),
+            resource_value,
+        )
+        return tuple(array[index] for array in self.arrays)
+
+
+DEFAULT_OUTCOMES = OutcomeTable()
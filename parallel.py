@@ -0,0 +1,467 @@
+import multiprocessing
+import os
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from engine import (
+    DIRECTIONS, FAMILIES, MAX_RESOURCE, MAX_STRENGTH, OFFSPRING_STRENGTH, REPRODUCTION_STRENGTH,
+    STEPS, FIGHTS, COOPERATIONS,
+)
+from outcomes import DEFAULT_OUTCOMES
+
+# The world is cut into strips of whole columns, one per worker process.
+# Cells are numbered x * height + y, so each strip is a contiguous range of
+# every per-cell array below, and all of them live in shared memory. A worker
+# only ever writes the cells of its own strip; it reads one column on either
+# side (the halo) straight from the shared arrays. The step uses the same
+# rules as ArrayWorld and is split into phases separated by barriers:
+#
+#   decay   own organisms: age, drop the dead, pick a direction
+#   claim   own cells that own or halo organisms move to: choose the
+#           claimant among the neighbours moving in, settle the interaction
+#           with the occupant
+#   settle  own cells that were occupied or claimed: work out who ends up
+#           there and with what strength
+#   local   own organisms: reproduction and resources within the strip
+#
+# Every phase works on the strip's organisms and the cells they move to,
+# never on every cell, so a step costs time in proportion to the population
+# (plus the halo columns and the den resources).
+#
+# Offspring are placed on a free cell of the parent's block (a run of about
+# 64k cells inside the strip) and each block gets its share of the den
+# resources, so nothing crosses a strip border except moves, which the
+# claim/settle phases resolve.
+
+CELL_ARRAYS = [
+    ("family", np.int32),          # occupant's family, -1 when empty
+    ("strength", np.int8),
+    ("decayed_family", np.int32),  # after the decay phase
+    ("decayed_strength", np.int8),
+    ("direction", np.int8),        # chosen move, where decayed_family >= 0
+    ("claim", np.int8),            # direction of the claimant moving in, -1 for none
+    ("moved_in", np.bool_),
+    ("loser", np.int8),            # 0 none, 1 the claimant lost, 2 the occupant lost
+    ("claimant_gain", np.int8),
+    ("occupant_gain", np.int8),
+]
+NO_LOSER, CLAIMANT_LOST, OCCUPANT_LOST = 0, 1, 2
+
+
+def strip_bounds(width, workers):
+    edges = np.linspace(0, width, workers + 1).round().astype(int)
+    return [(int(edges[i]), int(edges[i + 1])) for i in range(workers)]
+
+
+class SharedArrays:
+    def __init__(self, area, families, workers, names=None):
+        specs = CELL_ARRAYS + [("stats", np.int64), ("population", np.int64)]
+        sizes = {name: area for name, _ in CELL_ARRAYS}
+        sizes["stats"] = workers * len(families) * 3
+        sizes["population"] = workers
+        self.blocks = {}
+        self.owner = names is None
+        for name, dtype in specs:
+            nbytes = max(sizes[name] * np.dtype(dtype).itemsize, 1)
+            if names is None:
+                block = shared_memory.SharedMemory(create=True, size=nbytes)
+            else:
+                block = shared_memory.SharedMemory(name=names[name])
+            self.blocks[name] = block
+            setattr(self, name, np.ndarray(sizes[name], dtype=dtype, buffer=block.buf))
+        self.stats = self.stats.reshape(workers, len(families), 3)
+
+    def clear(self):
+        # An empty world. Apart from family and strength, the cell arrays are
+        # only looked at where a phase wrote them this step, but decayed_family
+        # must be -1 and claim -1 everywhere else.
+        self.family[:] = -1
+        self.strength[:] = 0
+        self.decayed_family[:] = -1
+        self.claim[:] = -1
+        self.stats[:] = 0
+        self.population[:] = 0
+
+    def names(self):
+        return {name: block.name for name, block in self.blocks.items()}
+
+    def close(self):
+        for name in list(self.blocks):
+            delattr(self, name)
+        for block in self.blocks.values():
+            block.close()
+            if self.owner:
+                block.unlink()
+        self.blocks = {}
+
+
+class Strip:
+    # One worker's share of the world. decay, claim and settle only touch the
+    # strip's occupied cells (kept sorted in self.occupied between steps), the
+    # cells they move to and the halo columns, so like ArrayWorld.step they
+    # cost time in proportion to the population rather than the area. local()
+    # goes through the strip in blocks of about BLOCK_CELLS cells, each with
+    # its share of the den resources.
+    BLOCK_CELLS = 1 << 16
+
+    def __init__(self, arrays, width, height, bounds, den_share, family_count, stats, rng, population=None):
+        self.a = arrays
+        self.width = width
+        self.height = height
+        self.family_count = family_count
+        self.stats = stats
+        self.population = population
+        self.rng = rng
+        self.offsets = DIRECTIONS[:, 0] * height + DIRECTIONS[:, 1]
+        lo, hi = bounds[0] * height, bounds[1] * height
+        self.lo, self.hi = lo, hi
+        # The neighbouring strips' border columns, whose organisms can move
+        # into this strip.
+        self.halo = np.concatenate([
+            np.arange(max(lo - height, 0), lo), np.arange(hi, min(hi + height, width * height)),
+        ])
+        count = max(1, -(-(hi - lo) // self.BLOCK_CELLS))
+        edges = np.linspace(lo, hi, count + 1).round().astype(np.int64)
+        self.blocks = [(int(edges[i]), int(edges[i + 1])) for i in range(count) if edges[i] < edges[i + 1]]
+        sizes = [block_hi - block_lo for block_lo, block_hi in self.blocks]
+        self.den_shares = [den_share * size // max(hi - lo, 1) for size in sizes]
+        for i in range(den_share - sum(self.den_shares)):
+            self.den_shares[i % len(self.blocks)] += 1
+        self.occupied = None
+        # Scratch space over the strip, left zeroed between uses: the best
+        # claim priority per cell, and marks for listing cells in order.
+        self.best = np.zeros(hi - lo, dtype=np.int8)
+        self.mark = np.zeros(hi - lo, dtype=bool)
+
+    def rescan(self):
+        # Finds the occupied cells again after organisms were placed from
+        # outside the worker.
+        self.occupied = np.flatnonzero(self.a.family[self.lo:self.hi] >= 0) + self.lo
+
+    def _open(self, cells):
+        # Which of the DIRECTIONS stay on the grid, as a (cells, 4) array.
+        x, y = np.divmod(cells, self.height)
+        return np.stack([x < self.width - 1, x > 0, y < self.height - 1, y > 0], axis=1)
+
+    def _own(self, cells):
+        return (cells >= self.lo) & (cells < self.hi)
+
+    def _unique(self, cells):
+        # The distinct cells of this strip, in ascending order: a sort for a
+        # few cells, a pass over the marks once they are a sizeable part of
+        # the strip.
+        if len(cells) * 16 < len(self.mark):
+            return unique_sorted(cells)
+        self.mark[cells - self.lo] = True
+        cells = np.flatnonzero(self.mark)
+        self.mark[cells] = False
+        return cells + self.lo
+
+    def decay(self):
+        a = self.a
+        if self.occupied is None:
+            self.rescan()
+        cells = self.occupied
+        family = a.family[cells].astype(np.int64)
+        strength = a.strength[cells].astype(np.int64) - 1
+        alive = strength > 0
+        a.decayed_family[cells] = np.where(alive, family, -1)
+        a.decayed_strength[cells] = np.where(alive, strength, 0)
+        self.stats[:, STEPS] += np.bincount(family[alive], minlength=self.family_count)
+
+        live = cells[alive]
+        # Away from the edges every direction is open and the pick is the
+        # direction itself; only organisms on an edge pick among fewer.
+        x, y = np.divmod(live, self.height)
+        edge = np.flatnonzero((x == 0) | (x == self.width - 1) | (y == 0) | (y == self.height - 1))
+        valid = self._open(live[edge])
+        count = np.full(len(live), len(DIRECTIONS), dtype=np.int64)
+        count[edge] = valid.sum(axis=1)
+        direction = (self.rng.random(len(live)) * count).astype(np.int64)
+        direction[edge] = (np.cumsum(valid, axis=1) > direction[edge, None]).argmax(axis=1)
+        a.direction[live] = direction
+        self.live = live
+        self.directions = direction
+
+    def claim(self):
+        # Movers into this strip are its own organisms and those in the halo
+        # (whose directions their own strip wrote during decay). Per target
+        # cell the highest priority (strength, then the earlier direction)
+        # claims it, as in ArrayWorld.step.
+        a = self.a
+        halo = self.halo[a.decayed_family[self.halo] >= 0]
+        movers = np.concatenate([self.live, halo])
+        direction = np.concatenate([self.directions, a.direction[halo].astype(np.int64)])
+        target = movers + self.offsets[direction]
+        inside = self._own(target)
+        movers, direction, target = movers[inside], direction[inside], target[inside] - self.lo
+        count = len(DIRECTIONS)
+        priority = (a.decayed_strength[movers] * count + (count - direction)).astype(np.int8)
+        best = self.best
+        # Movers going the same way have different targets, so each
+        # direction is one plain scatter.
+        for d in range(count):
+            going = direction == d
+            cells, value = target[going], priority[going]
+            best[cells] = np.maximum(best[cells], value)
+        won = best[target] == priority
+        best[target] = 0
+        a.claim[target[won] + self.lo] = direction[won]
+        cells = self._unique(target[won] + self.lo)
+        self.claimed = cells
+        direction = a.claim[cells].astype(np.int64)
+        source = cells - self.offsets[direction]
+
+        occupant_family = a.decayed_family[cells].astype(np.int64)
+        contested = occupant_family >= 0
+        claimant_family = a.decayed_family[source].astype(np.int64)
+        claimant_strength = a.decayed_strength[source].astype(np.int64)
+        occupant_strength = a.decayed_strength[cells].astype(np.int64)
+
+        resource_value = np.zeros(len(cells), dtype=np.int64)
+        resource_value[contested] = self.rng.integers(1, MAX_RESOURCE + 1, size=int(contested.sum()))
+        fight, claimant_wins, claimant_gain, occupant_gain = DEFAULT_OUTCOMES.gather(
+            claimant_family == occupant_family, claimant_strength, occupant_strength, resource_value
+        )
+        fight &= contested
+        cooperate = contested & ~fight
+
+        a.claim[cells] = direction
+        a.moved_in[cells] = ~contested | (fight & claimant_wins)
+        a.loser[cells] = np.where(fight, np.where(claimant_wins, OCCUPANT_LOST, CLAIMANT_LOST), NO_LOSER)
+        # The table's gains are already capped; capped gains add up to the
+        # same final strength, which settle() caps again.
+        a.claimant_gain[cells] = np.where(contested, claimant_gain, 0)
+        a.occupant_gain[cells] = np.where(contested, occupant_gain, 0)
+
+        winner_family = np.where(claimant_wins, claimant_family, occupant_family)
+        count = self.family_count
+        self.stats[:, FIGHTS] += np.bincount(winner_family[fight], minlength=count)
+        self.stats[:, COOPERATIONS] += np.bincount(claimant_family[cooperate], minlength=count)
+        self.stats[:, COOPERATIONS] += np.bincount(occupant_family[cooperate], minlength=count)
+
+    def settle(self):
+        # Only the cells occupied at the start of the step and the claimed
+        # ones can change; the rest stay empty.
+        a = self.a
+        cells = self._unique(np.concatenate([self.occupied, self.claimed]))
+        self.settled = cells
+        family = a.decayed_family[cells]
+        present = family >= 0
+        direction = a.direction[cells].astype(np.int64)
+        target = np.where(present, cells + self.offsets[np.maximum(direction, 0)], cells)
+        claimed = present & (a.claim[target] == direction)
+        dead = (a.loser[cells] == OCCUPANT_LOST) | (claimed & (a.loser[target] == CLAIMANT_LOST))
+        moved = claimed & a.moved_in[target]
+        stays = present & ~dead & ~moved
+        gain = a.occupant_gain[cells].astype(np.int64) + np.where(claimed, a.claimant_gain[target], 0)
+        stay_strength = a.decayed_strength[cells] + gain
+
+        incoming = a.moved_in[cells].copy()
+        claim = a.claim[cells].astype(np.int64)
+        source = np.where(incoming, cells - self.offsets[np.maximum(claim, 0)], cells)
+        incoming &= a.loser[source] != OCCUPANT_LOST
+        incoming_strength = (
+            a.decayed_strength[source].astype(np.int64) + a.claimant_gain[cells] + a.occupant_gain[source]
+        )
+
+        a.family[cells] = np.where(incoming, a.decayed_family[source], np.where(stays, family, -1))
+        a.strength[cells] = np.minimum(
+            np.where(incoming, incoming_strength, np.where(stays, stay_strength, 0)), MAX_STRENGTH
+        )
+
+    def local(self):
+        a = self.a
+        # Nobody reads the claim results any more: clear them for the next
+        # step, and bring decayed_family back in line with family.
+        claimed = self.claimed
+        a.claim[claimed] = -1
+        a.moved_in[claimed] = False
+        a.loser[claimed] = NO_LOSER
+        a.claimant_gain[claimed] = 0
+        a.occupant_gain[claimed] = 0
+        settled = self.settled
+        occupied = settled[a.family[settled] >= 0]
+        edges = np.searchsorted(occupied, [lo for lo, _ in self.blocks] + [self.hi])
+        born = [
+            self._local(lo, hi, den, occupied[edges[i]:edges[i + 1]])
+            for i, ((lo, hi), den) in enumerate(zip(self.blocks, self.den_shares))
+        ]
+        born = np.concatenate(born) if born else np.empty(0, dtype=np.int64)
+        a.decayed_family[settled] = a.family[settled]
+        a.decayed_family[born] = a.family[born]
+        self.occupied = self._unique(np.concatenate([occupied, born]))
+        if self.population is not None:
+            self.population[0] = len(self.occupied)
+
+    def _local(self, lo, hi, den, cells):
+        # Reproduction and resources in one block, for its occupied cells;
+        # returns the cells of the offspring.
+        a = self.a
+        size = hi - lo
+        strength = a.strength[cells].astype(np.int64)
+        if den:
+            resources = np.zeros(size, dtype=np.int64)
+            spots = self.rng.choice(size, size=min(den, size), replace=False, shuffle=False)
+            resources[spots] = self.rng.integers(1, MAX_RESOURCE + 1, size=len(spots))
+            found = resources[cells - lo]
+        else:
+            found = 0
+
+        parents = np.flatnonzero(strength >= REPRODUCTION_STRENGTH)
+        spots = np.empty(0, dtype=np.int64)
+        if len(parents):
+            free = np.flatnonzero(a.family[lo:hi] < 0)
+            if len(parents) > len(free):
+                parents = np.sort(self.rng.choice(parents, size=len(free), replace=False))
+            spots = self.rng.choice(free, size=len(parents), replace=False) + lo
+            strength[parents] = OFFSPRING_STRENGTH
+        a.strength[cells] = np.minimum(strength + found, MAX_STRENGTH)
+        if len(parents):
+            a.family[spots] = a.family[cells[parents]]
+            a.strength[spots] = OFFSPRING_STRENGTH
+        return spots
+
+
+def unique_sorted(cells):
+    cells = np.sort(cells)
+    keep = np.ones(len(cells), dtype=bool)
+    keep[1:] = cells[1:] != cells[:-1]
+    return cells[keep]
+
+
+def _worker(index, width, height, bounds, den_share, families, workers, names, seed, barrier, connection):
+    arrays = SharedArrays(width * height, families, workers, names)
+    strip = Strip(
+        arrays, width, height, bounds, den_share, len(families), arrays.stats[index], np.random.default_rng(seed),
+        arrays.population[index:index + 1],
+    )
+    try:
+        while True:
+            command, steps, placed = connection.recv()
+            if command == "stop":
+                break
+            if placed:
+                strip.rescan()
+            for _ in range(steps):
+                strip.decay()
+                barrier.wait()
+                strip.claim()
+                barrier.wait()
+                strip.settle()
+                barrier.wait()
+                strip.local()
+                barrier.wait()
+            connection.send(steps)
+    finally:
+        del strip
+        arrays.close()
+
+
+class ParallelWorld:
+    def __init__(self, width, height, den, workers=None, families=FAMILIES, seed=None, context=None):
+        workers = min(workers or os.cpu_count(), width)
+        self.width = width
+        self.height = height
+        self.den = den
+        self.families = list(families)
+        self.workers = workers
+        self.step_count = 0
+        self.arrays = SharedArrays(width * height, self.families, workers)
+        self.arrays.clear()
+        # Set when organisms are placed from here, so the workers look for
+        # their occupied cells again before the next step.
+        self.placed = True
+
+        seed_sequence = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+        placement, *streams = seed_sequence.spawn(workers + 1)
+        self.bounds = strip_bounds(width, workers)
+        area = width * height
+        shares = [den * (hi - lo) * height // area for lo, hi in self.bounds]
+        for i in range(den - sum(shares)):
+            shares[i % workers] += 1
+
+        context = context or multiprocessing.get_context()
+        barrier = context.Barrier(workers)
+        self.connections = []
+        self.processes = []
+        for index, bounds in enumerate(self.bounds):
+            parent, child = context.Pipe()
+            process = context.Process(
+                target=_worker,
+                args=(index, width, height, bounds, shares[index], self.families, workers,
+                      self.arrays.names(), streams[index], barrier, child),
+                daemon=True,
+            )
+            process.start()
+            self.connections.append(parent)
+            self.processes.append(process)
+        self.placement_rng = np.random.default_rng(placement)
+
+    def place_initial(self, per_family=1, strength=5):
+        count = len(self.families) * per_family
+        if count > self.width * self.height:
+            raise ValueError(f"{count} organisms do not fit on a {self.width}x{self.height} grid")
+        cells = self.placement_rng.choice(self.width * self.height, size=count, replace=False)
+        self.arrays.family[cells] = np.repeat(np.arange(len(self.families)), per_family)
+        self.arrays.strength[cells] = strength
+        self.placed = True
+
+    def add(self, x, y, family, strength=5):
+        cells = np.asarray(x) * self.height + np.asarray(y)
+        self.arrays.family[cells] = family
+        self.arrays.strength[cells] = strength
+        self.placed = True
+
+    @property
+    def size(self):
+        if self.placed:
+            return int((self.arrays.family >= 0).sum())
+        return int(self.arrays.population.sum())
+
+    @property
+    def full(self):
+        return self.size >= self.width * self.height
+
+    def run(self, steps):
+        for connection in self.connections:
+            connection.send(("run", steps, self.placed))
+        for connection in self.connections:
+            connection.recv()
+        self.placed = False
+        self.step_count += steps
+        return self.family_stats()
+
+    def step(self):
+        self.run(1)
+
+    def family_grid(self):
+        return self.arrays.family.reshape(self.width, self.height).astype(np.int64)
+
+    def strength_grid(self):
+        return self.arrays.strength.reshape(self.width, self.height).astype(np.int64)
+
+    def family_stats(self):
+        totals = self.arrays.stats.sum(axis=0)
+        return {
+            label: {"steps": int(row[STEPS]), "fights": int(row[FIGHTS]), "cooperations": int(row[COOPERATIONS])}
+            for label, row in zip(self.families, totals)
+            if row.any()
+        }
+
+    def close(self):
+        if not self.processes:
+            return
+        for connection in self.connections:
+            connection.send(("stop", 0, False))
+        for process in self.processes:
+            process.join()
+        self.processes = []
+        self.arrays.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
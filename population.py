@@ -0,0 +1,206 @@
+from array import array
+
+import numpy as np
+
+from sim import Organism
+
+# The per-organism columns an OrganismView reads: name, array typecode and
+# the matching NumPy dtype.
+COLUMNS = (("x", "i", np.int32), ("y", "i", np.int32), ("family", "i", np.int32), ("strength", "b", np.int8))
+
+
+class PopulationStore:
+    # Organisms as rows of fixed-size arrays (about 14 bytes each) instead of
+    # one Python object per organism. Slots of dead organisms go on a free
+    # stack and are handed out again before the arrays grow; compact() packs
+    # the live rows to the front in place. Families are integer ids into
+    # families (the labels), as on Organism.
+    #
+    # Each column is a C array (x_values, ...) that views read and write one
+    # item at a time, which is several times faster than indexing NumPy,
+    # shared with a NumPy array of the same name (x, ...) for the batch
+    # operations.
+    def __init__(self, families, capacity=1024):
+        self.families = list(families)
+        for name, code, dtype in COLUMNS:
+            self._allocate(name, code, dtype, capacity)
+        self.live = np.zeros(capacity, dtype=bool)
+        # Free slots, popped from the end so low slots are reused first.
+        self.free = np.arange(capacity - 1, -1, -1, dtype=np.int64)
+        self.free_count = capacity
+        self.size = 0
+        # One past the highest slot handed out since the last compact(); the
+        # free slots below it are holes.
+        self.top = 0
+
+    @property
+    def capacity(self):
+        return len(self.live)
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        for slot in self.live_slots().tolist():
+            yield OrganismView(self, slot)
+
+    def nbytes(self):
+        return sum(array.nbytes for array in (self.x, self.y, self.family, self.strength, self.live, self.free))
+
+    def live_slots(self):
+        return np.flatnonzero(self.live)
+
+    def view(self, slot):
+        return OrganismView(self, slot)
+
+    def new(self, family, strength=5):
+        # Stands in for Organism(family, strength).
+        return OrganismView(self, self.add(family, strength))
+
+    def add(self, family, strength=5, x=0, y=0):
+        if not self.free_count:
+            self._grow(self.capacity + 1)
+        self.free_count -= 1
+        slot = int(self.free[self.free_count])
+        self.x[slot] = x
+        self.y[slot] = y
+        self.family[slot] = family
+        self.strength[slot] = strength
+        self.live[slot] = True
+        self.size += 1
+        self.top = max(self.top, slot + 1)
+        return slot
+
+    def add_many(self, family, strength, x, y):
+        count = len(family)
+        if count > self.free_count:
+            self._grow(self.size + count)
+        self.free_count -= count
+        slots = self.free[self.free_count:self.free_count + count][::-1].copy()
+        self.x[slots] = x
+        self.y[slots] = y
+        self.family[slots] = family
+        self.strength[slots] = strength
+        self.live[slots] = True
+        self.size += count
+        if count:
+            self.top = max(self.top, int(slots.max()) + 1)
+        return slots
+
+    def remove(self, slot):
+        if self.live[slot]:
+            self.live[slot] = False
+            self.free[self.free_count] = slot
+            self.free_count += 1
+            self.size -= 1
+
+    def remove_many(self, slots):
+        slots = np.unique(slots)
+        slots = slots[self.live[slots]]
+        self.live[slots] = False
+        self.free[self.free_count:self.free_count + len(slots)] = slots
+        self.free_count += len(slots)
+        self.size -= len(slots)
+
+    def fragmented(self):
+        # Whether more than half the slots in use are holes.
+        return self.top - self.size > max(self.size, 64)
+
+    def compact(self, views=()):
+        # Returns the old slot of every live organism, in its new slot order,
+        # so callers holding slot numbers can remap them. views (live
+        # OrganismViews) are moved to their new slots.
+        order = self.live_slots()
+        size = len(order)
+        for array in (self.x, self.y, self.family, self.strength):
+            array[:size] = array[order]
+        self.live[:size] = True
+        self.live[size:] = False
+        self.free_count = self.capacity - size
+        self.free[:self.free_count] = np.arange(self.capacity - 1, size - 1, -1)
+        self.top = size
+        slots = np.empty(self.capacity, dtype=np.int64)
+        slots[order] = np.arange(size)
+        slots = slots.tolist()
+        for view in views:
+            view.slot = slots[view.slot]
+        return order
+
+    def _allocate(self, name, code, dtype, capacity):
+        values = array(code, bytes(capacity * np.dtype(dtype).itemsize))
+        setattr(self, name + "_values", values)
+        setattr(self, name, np.frombuffer(values, dtype=dtype))
+
+    def _grow(self, needed):
+        old = self.capacity
+        capacity = max(needed, 2 * old, 16)
+        for name, code, dtype in COLUMNS:
+            column = getattr(self, name)
+            self._allocate(name, code, dtype, capacity)
+            getattr(self, name)[:old] = column
+        live = np.zeros(capacity, dtype=bool)
+        live[:old] = self.live
+        self.live = live
+        free = np.empty(capacity, dtype=np.int64)
+        free[:capacity - old] = np.arange(capacity - 1, old - 1, -1)
+        free[capacity - old:capacity - old + self.free_count] = self.free[:self.free_count]
+        self.free = free
+        self.free_count += capacity - old
+
+
+class OrganismView:
+    # Behaves like an Organism (family, strength, x, y and the same methods)
+    # but reads and writes a row of a PopulationStore.
+    __slots__ = ("store", "slot")
+
+    def __init__(self, store, slot):
+        self.store = store
+        self.slot = slot
+
+    @property
+    def family(self):
+        return self.store.family_values[self.slot]
+
+    @family.setter
+    def family(self, family):
+        self.store.family_values[self.slot] = family
+
+    @property
+    def strength(self):
+        return self.store.strength_values[self.slot]
+
+    @strength.setter
+    def strength(self, strength):
+        self.store.strength_values[self.slot] = strength
+
+    @property
+    def x(self):
+        return self.store.x_values[self.slot]
+
+    @x.setter
+    def x(self, x):
+        self.store.x_values[self.slot] = x
+
+    @property
+    def y(self):
+        return self.store.y_values[self.slot]
+
+    @y.setter
+    def y(self, y):
+        self.store.y_values[self.slot] = y
+
+    consume = Organism.consume
+    interact_with = Organism.interact_with
+    calculate_fight_gain = Organism.calculate_fight_gain
+
+    def reproduce(self):
+        if self.strength >= 8:
+            self.strength = 4
+            return self.store.new(self.family, strength=4)
+        return None
+
+    def __eq__(self, other):
+        return isinstance(other, OrganismView) and other.store is self.store and other.slot == self.slot
+
+    def __hash__(self):
+        return hash((id(self.store), self.slot))
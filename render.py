@@ -0,0 +1,67 @@
+import sys
+import time
+
+CLEAR_SCREEN = "\x1b[2J\x1b[H"
+HIDE_CURSOR = "\x1b[?25l"
+SHOW_CURSOR = "\x1b[?25h"
+
+
+def move_to(row, column):
+    return f"\x1b[{row};{column}H"
+
+
+class TerminalRenderer:
+    # Keeps the last frame it drew as a {(x, y): label} map of occupied cells
+    # and only rewrites the cells that changed, so the cost of a frame follows
+    # the population rather than the grid area. With max_fps set, frames that
+    # arrive too soon after the last one drawn are skipped; the next drawn
+    # frame is diffed against what is actually on screen. cells can be a
+    # callable returning the map, so a skipped frame is never built. Every
+    # cell is cell_width characters wide (the longest family label) plus a
+    # separating space.
+    def __init__(self, width, height, out=None, max_fps=None, clock=time.monotonic, cell_width=1):
+        self.width = width
+        self.height = height
+        self.cell_width = cell_width
+        self.empty = ".".ljust(cell_width)
+        self.out = out if out is not None else sys.stdout
+        self.min_interval = 1 / max_fps if max_fps else 0
+        self.clock = clock
+        self.previous = None
+        self.last_frame = None
+        self.frames_drawn = 0
+        self.frames_skipped = 0
+
+    def draw(self, cells, status="", force=False):
+        now = self.clock()
+        if not force and self.last_frame is not None and now - self.last_frame < self.min_interval:
+            self.frames_skipped += 1
+            return False
+        self.last_frame = now
+        if callable(cells):
+            cells = cells()
+
+        parts = []
+        if self.previous is None:
+            parts.append(HIDE_CURSOR + CLEAR_SCREEN)
+            empty = " ".join([self.empty] * self.width)
+            parts.extend(empty + "\n" for _ in range(self.height))
+            self.previous = {}
+        previous = self.previous
+        step = self.cell_width + 1
+        for (x, y), label in cells.items():
+            if previous.get((x, y)) != label:
+                parts.append(move_to(y + 1, x * step + 1) + label.ljust(self.cell_width))
+        for (x, y) in previous.keys() - cells.keys():
+            parts.append(move_to(y + 1, x * step + 1) + self.empty)
+        parts.append(move_to(self.height + 2, 1) + "\x1b[2K" + status)
+        self.out.write("".join(parts))
+        self.out.flush()
+        self.previous = dict(cells)
+        self.frames_drawn += 1
+        return True
+
+    def close(self):
+        if self.previous is not None:
+            self.out.write(move_to(self.height + 3, 1) + SHOW_CURSOR)
+            self.out.flush()
@@ -0,0 +1,186 @@
+from outcomes import MAX_STRENGTH
+
+PLACEMENTS = ("uniform", "clustered", "file")
+# Rounds of redrawing clashing organisms in a clustered layout, each with a
+# wider spread, before the rest are scattered uniformly over the free cells.
+CLUSTER_ROUNDS = 8
+
+
+def parse_strength(text):
+    # "5" (everyone starts at 5), "3-8" (uniform over 3..8) or "5~1.5"
+    # (normal, rounded and clipped to 1..MAX_STRENGTH). Strengths are
+    # 1..MAX_STRENGTH.
+    text = str(text)
+    try:
+        if "~" in text:
+            mean, deviation = text.split("~")
+            return ("normal", float(mean), float(deviation))
+        if "-" in text[1:]:
+            low, high = text.split("-", 1)
+            low, high = int(low), int(high)
+            if not 1 <= low <= high <= MAX_STRENGTH:
+                raise ValueError
+            return ("uniform", low, high)
+        if not 1 <= int(text) <= MAX_STRENGTH:
+            raise ValueError
+        return ("fixed", int(text))
+    except ValueError:
+        raise ValueError(f"bad strength {text!r}: expected N, LOW-HIGH or MEAN~DEVIATION within 1..{MAX_STRENGTH}") from None
+
+
+def read_population(path):
+    # x, y, family and (if present) strength arrays from an .npz with those
+    # names (a checkpoint works) or a CSV file with a header naming them.
+    import numpy as np
+
+    if path.endswith(".npz"):
+        with np.load(path) as data:
+            columns = {name: data[name] for name in ("x", "y", "family", "strength", "on_grid") if name in data.files}
+        if "on_grid" in columns:
+            # An object-engine checkpoint: skip organisms displaced from the grid.
+            on_grid = columns.pop("on_grid")
+            columns = {name: column[on_grid] for name, column in columns.items()}
+    else:
+        data = np.genfromtxt(path, delimiter=",", names=True, dtype=np.int64)
+        data = np.atleast_1d(data)
+        columns = {name: data[name] for name in data.dtype.names}
+    missing = {"x", "y", "family"} - set(columns)
+    if missing:
+        raise ValueError(f"{path} has no {', '.join(sorted(missing))} column")
+    strength = columns.get("strength")
+    return (
+        columns["x"].astype(np.int64),
+        columns["y"].astype(np.int64),
+        columns["family"].astype(np.int64),
+        strength.astype(np.int64) if strength is not None else None,
+    )
+
+
+class Seeding:
+    # The initial population: per_family organisms of every family, with
+    # strengths drawn from `strength` (see parse_strength), laid out by
+    # `placement`:
+    #   uniform    cells drawn without replacement from the whole grid
+    #   clustered  each family around `clusters` random centres, with a
+    #              normal spread of `spread` cells
+    #   file       the organisms in `path` (see read_population)
+    # sample() returns x, y, family and strength arrays, worked out with a
+    # few array operations over the population, so a world of 100M cells
+    # with millions of organisms is set up in seconds.
+    def __init__(self, per_family=1, strength=5, placement="uniform", clusters=1, spread=None, path=None):
+        if placement not in PLACEMENTS:
+            raise ValueError(f"unknown placement {placement!r}")
+        if placement == "file" and path is None:
+            raise ValueError("file placement needs a path")
+        self.per_family = per_family
+        self.strength = parse_strength(strength)
+        self.placement = placement
+        self.clusters = clusters
+        self.spread = spread
+        self.path = path
+
+    def sample(self, width, height, families, rng, topology="bounded"):
+        import numpy as np
+
+        if self.placement == "file":
+            x, y, family, strength = read_population(self.path)
+            check_population(width, height, families, x, y, family)
+            if strength is None:
+                strength = self.strengths(len(x), rng)
+            return x, y, family, strength
+        count = families * self.per_family
+        if count > width * height:
+            raise ValueError(f"{count} organisms do not fit on a {width}x{height} grid")
+        if self.placement == "uniform":
+            # The same draws as ArrayWorld.place_initial.
+            cells = rng.choice(width * height, size=count, replace=False, shuffle=False)
+            cells = rng.permutation(cells)
+            family = np.repeat(np.arange(families), self.per_family)
+        else:
+            family = rng.permutation(np.repeat(np.arange(families), self.per_family))
+            cells = self.cluster_cells(width, height, families, family, rng, topology)
+        return cells // height, cells % height, family, self.strengths(count, rng)
+
+    def strengths(self, count, rng):
+        import numpy as np
+
+        kind, *parameters = self.strength
+        if kind == "fixed":
+            return np.full(count, parameters[0], dtype=np.int64)
+        if kind == "uniform":
+            low, high = parameters
+            return rng.integers(low, high + 1, size=count)
+        mean, deviation = parameters
+        return np.clip(np.rint(rng.normal(mean, deviation, size=count)), 1, MAX_STRENGTH).astype(np.int64)
+
+    def cluster_cells(self, width, height, families, family, rng, topology):
+        # Every organism draws a cell near one of its family's centres. Where
+        # several draw the same cell, or a cell already taken, one keeps it
+        # and the others draw again with a wider spread.
+        import numpy as np
+
+        count = len(family)
+        centres = rng.integers(0, [width, height], size=(families, self.clusters, 2))
+        centre = centres[family, rng.integers(0, self.clusters, size=count)]
+        spread = self.spread if self.spread is not None else max(1.0, np.sqrt(self.per_family / self.clusters))
+        # The organism holding each cell, or -1.
+        owner = np.full(width * height, -1, dtype=np.int32 if count < 2**31 else np.int64)
+        cells = np.full(count, -1, dtype=np.int64)
+        waiting = np.arange(count)
+        for _ in range(CLUSTER_ROUNDS):
+            position = np.rint(centre[waiting] + rng.normal(0, spread, size=(len(waiting), 2))).astype(np.int64)
+            if topology == "torus":
+                position %= (width, height)
+            else:
+                np.clip(position, 0, (width - 1, height - 1), out=position)
+            candidate = position[:, 0] * height + position[:, 1]
+            free = owner[candidate] < 0
+            # Of several organisms writing the same free cell, one write
+            # lands; organisms are in random order, so it is a random one.
+            owner[candidate[free]] = waiting[free]
+            placed = owner[candidate] == waiting
+            cells[waiting[placed]] = candidate[placed]
+            waiting = waiting[~placed]
+            if not len(waiting):
+                return cells
+            spread *= 1.5
+        cells[waiting] = rng.choice(np.flatnonzero(owner < 0), size=len(waiting), replace=False)
+        return cells
+
+
+def check_population(width, height, families, x, y, family):
+    import numpy as np
+
+    if ((x < 0) | (x >= width) | (y < 0) | (y >= height)).any():
+        raise ValueError("organism placed outside the grid")
+    if ((family < 0) | (family >= families)).any():
+        raise ValueError(f"family ids must be below the number of families ({families})")
+    cells = np.sort(x * height + y)
+    if (cells[1:] == cells[:-1]).any():
+        raise ValueError("two organisms share a cell")
+
+
+def add_arguments(parser):
+    group = parser.add_argument_group("initial population")
+    group.add_argument("--per-family", type=int, default=1, help="organisms per family at the start (default: 1)")
+    group.add_argument("--initial-strength", default="5", help="starting strength: N, LOW-HIGH (uniform) or MEAN~DEVIATION (normal) (default: 5)")
+    group.add_argument("--placement", choices=["uniform", "clustered"], default="uniform", help="scatter organisms over the grid, or group each family around a few centres (default: uniform)")
+    group.add_argument("--clusters", type=int, default=1, help="with --placement clustered, centres per family (default: 1)")
+    group.add_argument("--cluster-spread", type=float, help="with --placement clustered, standard deviation in cells around a centre (default: sqrt(per family / clusters))")
+    group.add_argument("--population", help="start from the organisms in this .npz (x, y, family[, strength]; a checkpoint works) or .csv file")
+
+
+def from_args(args):
+    # A Seeding for the options add_arguments() defined, or None when they
+    # ask for the original start (one organism per family, strength 5,
+    # placed uniformly).
+    if args.population is None and (args.per_family, args.initial_strength, args.placement) == (1, "5", "uniform"):
+        return None
+    return Seeding(
+        per_family=args.per_family,
+        strength=args.initial_strength,
+        placement="file" if args.population is not None else args.placement,
+        clusters=args.clusters,
+        spread=args.cluster_spread,
+        path=args.population,
+    )
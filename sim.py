@@ -1,35 +1,268 @@
+import argparse
+import json
+import math
 import random
-from collections import defaultdict
+from array import array
+
+import seeding
+import stopping
+from families import FAMILIES, FamilySeries, FamilyTable, family_labels, padded_labels
+from outcomes import DEFAULT_OUTCOMES, MAX_STRENGTH
+from topology import border_class, border_moves, directions
 
 class Grid:
-    def __init__(self, width, height):
+    # Failed draws while looking for a free cell; a dense grid never retries.
+    placement_retries = 0
+
+    def __init__(self, width, height, topology="bounded", neighbourhood="von-neumann"):
         self.width = width
         self.height = height
+        self.topology = topology
+        self.neighbourhood = neighbourhood
         self.cells = [[None for _ in range(height)] for _ in range(width)]
+        # Open moves as (direction, dx, dy) per border class, see
+        # topology.border_moves.
+        self.moves = border_moves(width, height, topology, neighbourhood)
+        # Empty cells (numbered x * height + y) in no particular order, plus
+        # each cell's position in that list (-1 when occupied), so a cell can
+        # be taken out or put back in O(1). Flat C arrays: 8 bytes per cell
+        # each, where a list of ints costs about 36.
+        self.free_cells = array("l", range(width * height))
+        self.free_index = array("l", self.free_cells)
 
     def in_bounds(self, x, y):
         return 0 <= x < self.width and 0 <= y < self.height
 
     def get_valid_adjacent_cells(self, x, y):
-        directions = [(1, 0), (-1, 0), (0, 1), (0, -1)]
-        valid_cells = []
-        for dx, dy in directions:
-            new_x, new_y = x + dx, y + dy
-            if self.in_bounds(new_x, new_y):
-                valid_cells.append((new_x, new_y))
-        return valid_cells
+        return self.neighbours_of(x, y)
+
+    def open_moves(self, x, y):
+        return self.moves[border_class(x, y, self.width, self.height)]
+
+    def neighbours_of(self, x, y):
+        return [self._target(x, y, dx, dy) for _, dx, dy in self.open_moves(x, y)]
+
+    def random_move(self, x, y, rng=random):
+        # (direction, x, y) of a random open move from (x, y); one draw, the
+        # same as rng.choice(self.neighbours_of(x, y)).
+        direction, dx, dy = rng.choice(self.open_moves(x, y))
+        return (direction, *self._target(x, y, dx, dy))
+
+    def _target(self, x, y, dx, dy):
+        if self.topology == "torus":
+            return (x + dx) % self.width, (y + dy) % self.height
+        return x + dx, y + dy
 
     def place_organism(self, organism, x, y):
+        if self.cells[x][y] is None:
+            self._take_free_cell(x * self.height + y)
         self.cells[x][y] = organism
         organism.x, organism.y = x, y
 
     def remove_organism(self, x, y):
+        if self.cells[x][y] is not None:
+            cell = x * self.height + y
+            self.free_index[cell] = len(self.free_cells)
+            self.free_cells.append(cell)
         self.cells[x][y] = None
 
+    def occupied_count(self):
+        return self.width * self.height - len(self.free_cells)
+
+    def is_full(self):
+        return not self.free_cells
+
+    def random_free_cell(self, rng=random):
+        if not self.free_cells:
+            return None
+        cell = self.free_cells[rng.randrange(len(self.free_cells))]
+        return cell // self.height, cell % self.height
+
+    def _take_free_cell(self, cell):
+        index = self.free_index[cell]
+        last = self.free_cells.pop()
+        if last != cell:
+            self.free_cells[index] = last
+            self.free_index[last] = index
+        self.free_index[cell] = -1
+
     def get_organism(self, x, y):
         return self.cells[x][y]
 
+    def scatter_resources(self, den, rng=random):
+        return ResourceField(generate_resources(self, den, rng))
+
+class SparseGrid(Grid):
+    # Same interface as Grid, but only chunks of chunk_size x chunk_size cells
+    # that hold an organism are allocated, so memory follows the population
+    # rather than the area. A chunk is dropped again when its last organism
+    # leaves.
+    def __init__(self, width, height, chunk_size=16, topology="bounded", neighbourhood="von-neumann"):
+        self.moves = border_moves(width, height, topology, neighbourhood)
+        self.width = width
+        self.height = height
+        self.topology = topology
+        self.neighbourhood = neighbourhood
+        self.chunk_size = chunk_size
+        self.chunks = {}
+        self.chunk_counts = {}
+        self.occupied = 0
+        self.placement_retries = 0
+
+    def get_organism(self, x, y):
+        size = self.chunk_size
+        chunk = self.chunks.get((x // size, y // size))
+        if chunk is None:
+            return None
+        return chunk[(x % size) * size + y % size]
+
+    def place_organism(self, organism, x, y):
+        size = self.chunk_size
+        key = (x // size, y // size)
+        chunk = self.chunks.get(key)
+        if chunk is None:
+            chunk = self.chunks[key] = [None] * (size * size)
+            self.chunk_counts[key] = 0
+        index = (x % size) * size + y % size
+        if chunk[index] is None:
+            self.chunk_counts[key] += 1
+            self.occupied += 1
+        chunk[index] = organism
+        organism.x, organism.y = x, y
+
+    def remove_organism(self, x, y):
+        size = self.chunk_size
+        key = (x // size, y // size)
+        chunk = self.chunks.get(key)
+        if chunk is None:
+            return
+        index = (x % size) * size + y % size
+        if chunk[index] is not None:
+            chunk[index] = None
+            self.occupied -= 1
+            self.chunk_counts[key] -= 1
+            if not self.chunk_counts[key]:
+                del self.chunks[key]
+                del self.chunk_counts[key]
+
+    def active_chunks(self):
+        return len(self.chunks)
+
+    def occupied_count(self):
+        return self.occupied
+
+    def is_full(self):
+        return self.occupied >= self.width * self.height
+
+    def random_free_cell(self, rng=random):
+        if self.is_full():
+            return None
+        # A mostly-empty world almost always accepts the first draw; the exact
+        # walk over chunk free counts is only needed once it fills up.
+        for _ in range(64):
+            x, y = generate_random_coordinates(self, rng)
+            if self.get_organism(x, y) is None:
+                return x, y
+            self.placement_retries += 1
+        return self._nth_free_cell(rng.randrange(self.width * self.height - self.occupied))
+
+    def _nth_free_cell(self, n):
+        size = self.chunk_size
+        for cx in range(-(-self.width // size)):
+            for cy in range(-(-self.height // size)):
+                columns = min(size, self.width - cx * size)
+                rows = min(size, self.height - cy * size)
+                free = columns * rows - self.chunk_counts.get((cx, cy), 0)
+                if n >= free:
+                    n -= free
+                    continue
+                chunk = self.chunks.get((cx, cy))
+                for i in range(columns):
+                    for j in range(rows):
+                        if chunk is None or chunk[i * size + j] is None:
+                            if not n:
+                                return cx * size + i, cy * size + j
+                            n -= 1
+        return None
+
+    def scatter_resources(self, den, rng=random):
+        return LazyResourceField(den / (self.width * self.height), rng)
+
+class ResourceField:
+    # One step's resources, as a width x height list of lists.
+    def __init__(self, values):
+        self.values = values
+
+    def get(self, x, y):
+        return self.values[x][y]
+
+    def set(self, x, y, value):
+        self.values[x][y] = value
+
+    # A fresh field is replaced every step, so eating does not use it up.
+    consume = get
+
+class LazyResourceField:
+    # One step's resources for a SparseGrid. A cell's resource is drawn the
+    # first time it is looked up (present with the grid's overall density),
+    # so a step costs one draw per cell its organisms move into rather than
+    # one per cell of the world.
+    def __init__(self, density, rng=random):
+        self.density = density
+        self.rng = rng
+        self.values = {}
+
+    def get(self, x, y):
+        value = self.values.get((x, y))
+        if value is None:
+            value = generate_resource(self.rng) if self.rng.random() < self.density else 0
+            self.values[(x, y)] = value
+        return value
+
+    def set(self, x, y, value):
+        self.values[(x, y)] = value
+
+    consume = get
+
+class RegrowingResources:
+    # Resources that stay on the grid from step to step until they are eaten
+    # (Simulation(resources="persistent")). An eaten cell grows a new resource
+    # after a delay: every step it has probability `regrowth` of doing so,
+    # which is drawn once, as a geometric delay, when the cell is eaten. A
+    # step therefore only touches the cells eaten or regrowing in it, not the
+    # whole grid. Cells that start out bare stay bare.
+    def __init__(self, field, regrowth, rng=random):
+        self.field = field
+        self.regrowth = regrowth
+        self.rng = rng
+        # Step -> cells that regrow at the start of it.
+        self.pending = {}
+        self.step = 0
+
+    def get(self, x, y):
+        return self.field.get(x, y)
+
+    def consume(self, x, y):
+        value = self.field.get(x, y)
+        if value:
+            self.field.set(x, y, 0)
+            if self.regrowth > 0:
+                self.pending.setdefault(self.step + self.regrowth_delay(), []).append((x, y))
+        return value
+
+    def regrowth_delay(self):
+        if self.regrowth >= 1:
+            return 1
+        return 1 + int(math.log(1.0 - self.rng.random()) / math.log(1.0 - self.regrowth))
+
+    def regrow(self, step):
+        self.step = step
+        for x, y in self.pending.pop(step, ()):
+            self.field.set(x, y, generate_resource(self.rng))
+
 class Organism:
+    __slots__ = ("family", "strength", "x", "y")
+
     def __init__(self, family, strength=5):
         self.family = family
         self.strength = strength
@@ -75,27 +308,45 @@ class Organism:
     def calculate_fight_gain(self, other, resource_value):
         return resource_value if self.strength > other.strength else 0
 
-def generate_random_coordinates(grid):
-    return random.randint(0, grid.width - 1), random.randint(0, grid.height - 1)
+def generate_random_coordinates(grid, rng=random):
+    return rng.randint(0, grid.width - 1), rng.randint(0, grid.height - 1)
+
+def generate_resource(rng=random):
+    return rng.randint(1, 10)
 
-def generate_resource():
-    return random.randint(1, 10)
+def generate_resources(grid, den, rng=random):
+    resources = [[0] * grid.height for _ in range(grid.width)]
+    cells = rng.sample(range(grid.width * grid.height), min(den, grid.width * grid.height))
+    for cell in cells:
+        resources[cell // grid.height][cell % grid.height] = generate_resource(rng)
+    return resources
 
-def place_initial_organisms(grid):
-    families = ["A", "B", "C", "D", "E"]
+def place_initial_organisms(grid, rng=random, families=FAMILIES, new=Organism):
+    # One organism per family; organisms carry the family's index in families.
+    # new(family) makes an organism (Organism, or a PopulationStore's new).
     organisms = []
-    for family in families:
-        x, y = generate_random_coordinates(grid)
-        while grid.get_organism(x, y) is not None:
-            x, y = generate_random_coordinates(grid)
-        organism = Organism(family)
+    for family in range(len(families)):
+        cell = grid.random_free_cell(rng)
+        if cell is None:
+            break
+        x, y = cell
+        organism = new(family)
         grid.place_organism(organism, x, y)
         organisms.append(organism)
     return organisms
 
-def move_organism(organism, grid):
-    valid_cells = grid.get_valid_adjacent_cells(organism.x, organism.y)
-    new_x, new_y = random.choice(valid_cells)
+def place_organisms(grid, x, y, family, strength, new=Organism):
+    # Organisms for a seeded population (see seeding.Seeding.sample), placed
+    # on their cells.
+    organisms = []
+    for x, y, family, strength in zip(x.tolist(), y.tolist(), family.tolist(), strength.tolist()):
+        organism = new(family, strength)
+        grid.place_organism(organism, x, y)
+        organisms.append(organism)
+    return organisms
+
+def move_organism(organism, grid, rng=random):
+    _, new_x, new_y = grid.random_move(organism.x, organism.y, rng)
     return new_x, new_y
 
 def interact(organism1, organism2, resource_value):
@@ -112,15 +363,20 @@ def interact(organism1, organism2, resource_value):
     return interaction, winner if interaction == "fight" else None
 10
 
-def print_grid(grid, organisms):
+def print_grid(grid, organisms, families=FAMILIES):
+    # Label families (Organism("A")) print as themselves.
+    named = sorted({organism.family for organism in organisms if isinstance(organism.family, str)})
+    padded, empty = padded_labels(list(families) + named)
+    labels = dict(zip(named, padded[len(families):]))
     for y in range(grid.height):
         row = []
         for x in range(grid.width):
             organism = grid.get_organism(x, y)
             if organism is not None:
-                row.append(organism.family)
+                family = organism.family
+                row.append(labels[family] if isinstance(family, str) else padded[family])
             else:
-                row.append(".")
+                row.append(empty)
         print(" ".join(row))
     print("")
 
@@ -133,53 +389,396 @@ def print_family_stats(family_stats, steps):
         print(f"  Fought {stats['fights']} times")
         print(f"  Cooperated {stats['cooperations']} times")
 
-def run_simulation(grid, organisms, steps, den):
-    family_stats = defaultdict(lambda: {"steps": 0, "fights": 0, "cooperations": 0})
+def make_random(seed=None):
+    # Accepts an int, None, or a numpy SeedSequence (e.g. one of the streams
+    # spawned for a sweep or a parallel worker).
+    if hasattr(seed, "generate_state"):
+        seed = int.from_bytes(seed.generate_state(8).tobytes(), "little")
+    return random.Random(seed)
 
-    for step in range(steps):
-        if len(organisms) >= grid.width * grid.height:
-            print("\nThe grid is full. Stopping the simulation.")
-            break
-        print(f"\nStep {step + 1}")
-        print_grid(grid, organisms)
-        updated_organisms = []
+def replicate_seed(seed, replicate):
+    from numpy.random import SeedSequence
 
-        resources = []
-        while len(resources) < den:
-            resource_x, resource_y = generate_random_coordinates(grid)
-            resource_value = generate_resource()
-            if (resource_x, resource_y) not in [coord for coord, value in resources]:
-                resources.append(((resource_x, resource_y), resource_value))
+    return SeedSequence(seed, spawn_key=(replicate,))
 
+def label_families(organisms, families=None):
+    # Returns the labels for organisms' integer family ids. Organisms made
+    # with label families (Organism("A")) are given ids in sorted label order.
+    if any(isinstance(organism.family, str) for organism in organisms):
+        families = sorted({organism.family for organism in organisms})
+        index = {family: i for i, family in enumerate(families)}
         for organism in organisms:
+            organism.family = index[organism.family]
+    elif families is None:
+        families = family_labels(max((organism.family for organism in organisms), default=-1) + 1)
+    return list(families)
+
+class Simulation:
+    events = None
+    profiler = None
+    # A families.FamilySeries once track_families() is called.
+    series = None
+    # A stopping.Stopper to end runs early. stop_reason and stopped_at record
+    # why and after which step a run stopped (the grid filling up included).
+    stopping = None
+    stop_reason = None
+    stopped_at = None
+    # The object engine's RegrowingResources with persistent resources;
+    # otherwise fresh resources are scattered every step.
+    resources = None
+    # How collisions are settled (object and array engines); an
+    # outcomes.OutcomeTable.
+    outcomes = DEFAULT_OUTCOMES
+    # Whether the object engine updates every organism against the same
+    # snapshot (see _step_synchronous) rather than one after another. The
+    # other engines always do.
+    synchronous = False
+    # The object engine's population.PopulationStore when organisms are rows
+    # of it (store=True) rather than Organism objects. Dead organisms' slots
+    # are reused for births, and step() compacts the store once it is mostly
+    # holes.
+    store = None
+
+    def __init__(
+        self, width, height, den, engine="object", seed=None, workers=None, sparse=False,
+        topology="bounded", neighbourhood="von-neumann", families=FAMILIES,
+        persistent_resources=False, regrowth=0.05, outcomes=None, synchronous=False,
+        seeding=None, store=False,
+    ):
+        if sparse and engine != "object":
+            raise ValueError("only the object engine has a sparse grid")
+        if store and engine != "object":
+            raise ValueError("only the object engine keeps organisms in a population store")
+        if persistent_resources and engine == "parallel":
+            raise ValueError("the parallel engine only scatters fresh resources")
+        if outcomes is not None and engine == "parallel":
+            raise ValueError("the parallel engine only has the default interactions")
+        if outcomes is not None:
+            self.outcomes = outcomes
+        self.synchronous = synchronous
+        if engine == "parallel" and (topology, neighbourhood) != ("bounded", "von-neumann"):
+            raise ValueError("the parallel engine only supports a bounded von Neumann grid")
+        self.den = den
+        self.engine = engine
+        self.families = list(families)
+        self.step_count = 0
+        # Callables run with the simulation after every step (checkpointing,
+        # tracing, ...). Nothing is called when the list is empty.
+        self.observers = []
+        if engine == "object":
+            self.rng = make_random(seed)
+            if sparse:
+                self.grid = SparseGrid(width, height, topology=topology, neighbourhood=neighbourhood)
+            else:
+                self.grid = Grid(width, height, topology, neighbourhood)
+            new = Organism
+            if store:
+                from population import PopulationStore
+
+                self.store = PopulationStore(self.families)
+                new = self.store.new
+            if seeding is None:
+                self.organisms = place_initial_organisms(self.grid, self.rng, self.families, new)
+            else:
+                import numpy as np
+
+                population = seeding.sample(width, height, len(self.families), np.random.default_rng(seed), topology)
+                self.organisms = place_organisms(self.grid, *population, new)
+            self.family_table = FamilyTable(self.families)
+            self.family_table.count(self.organisms)
+            if persistent_resources:
+                self.resources = RegrowingResources(self.grid.scatter_resources(den, self.rng), regrowth, self.rng)
+        elif engine == "array":
+            import numpy as np
+            from engine import ArrayWorld
+
+            self.world = ArrayWorld(
+                width, height, self.families, np.random.default_rng(seed), topology=topology, neighbourhood=neighbourhood,
+            )
+            self.world.outcomes = self.outcomes
+            if seeding is None:
+                self.world.place_initial()
+            else:
+                self.world.add(*seeding.sample(width, height, len(self.families), self.world.rng, topology))
+            if persistent_resources:
+                self.world.persist_resources(den, regrowth)
+        elif engine == "parallel":
+            from parallel import ParallelWorld
+
+            self.world = ParallelWorld(width, height, den, workers, self.families, seed=seed)
+            try:
+                if seeding is None:
+                    self.world.place_initial()
+                else:
+                    self.world.add(*seeding.sample(width, height, len(self.families), self.world.placement_rng))
+            except ValueError:
+                # Too many organisms for the grid: free the shared memory.
+                self.world.close()
+                raise
+        else:
+            raise ValueError(f"unknown engine {engine!r}")
+
+    @classmethod
+    def from_grid(cls, grid, organisms, den, rng=None, families=None, store=None, seed=None):
+        # store is the PopulationStore organisms are views of, if any. Without
+        # an rng, the simulation gets its own, built from seed.
+        simulation = cls.__new__(cls)
+        simulation.den = den
+        simulation.engine = "object"
+        simulation.families = label_families(organisms, families)
+        simulation.step_count = 0
+        simulation.observers = []
+        simulation.rng = rng if rng is not None else make_random(seed)
+        simulation.grid = grid
+        simulation.organisms = organisms
+        simulation.store = store
+        simulation.family_table = FamilyTable(simulation.families)
+        simulation.family_table.count(organisms)
+        return simulation
+
+    @property
+    def width(self):
+        return self.grid.width if self.engine == "object" else self.world.width
+
+    @property
+    def height(self):
+        return self.grid.height if self.engine == "object" else self.world.height
+
+    @property
+    def family_stats(self):
+        if self.engine != "object":
+            return self.world.family_stats()
+        return self.family_table.family_stats()
+
+    def population(self):
+        if self.engine != "object":
+            return self.world.size
+        return len(self.organisms)
+
+    def family_populations(self):
+        # Organisms per family id.
+        if self.engine == "object":
+            return list(self.family_table.population)
+        import numpy as np
+
+        family = self.world.family if self.engine == "array" else self.world.arrays.family
+        return np.bincount(family[family >= 0], minlength=len(self.world.families)).tolist()
+
+    def is_full(self):
+        if self.engine != "object":
+            return self.world.full
+        return len(self.organisms) >= self.grid.width * self.grid.height
+
+    def occupied_cells(self):
+        if self.engine != "object":
+            labels = self.world.families
+            family_grid = self.world.family_grid()
+            xs, ys = (family_grid >= 0).nonzero()
+            return {
+                (x, y): labels[family]
+                for x, y, family in zip(xs.tolist(), ys.tolist(), family_grid[xs, ys].tolist())
+            }
+        grid = self.grid
+        labels = self.families
+        return {
+            (organism.x, organism.y): labels[organism.family]
+            for organism in self.organisms
+            if grid.get_organism(organism.x, organism.y) is organism
+        }
+
+    def organism_arrays(self):
+        # x, y, family id and strength of every organism on the grid, as
+        # arrays.
+        import numpy as np
+
+        if self.engine == "array":
+            world = self.world
+            return world.x, world.y, world.family, world.strength
+        if self.engine == "parallel":
+            family = self.world.family_grid()
+            x, y = (family >= 0).nonzero()
+            return x, y, family[x, y], self.world.strength_grid()[x, y]
+        grid = self.grid
+        on_grid = [organism for organism in self.organisms if grid.get_organism(organism.x, organism.y) is organism]
+        return (
+            np.array([organism.x for organism in on_grid], dtype=np.int64),
+            np.array([organism.y for organism in on_grid], dtype=np.int64),
+            np.array([organism.family for organism in on_grid], dtype=np.int64),
+            np.array([organism.strength for organism in on_grid], dtype=np.int64),
+        )
+
+    def family_grid(self):
+        # A width x height array of family indices (-1 for an empty cell) and
+        # the labels those indices stand for.
+        if self.engine != "object":
+            return self.world.family_grid(), self.world.families
+        import numpy as np
+
+        x, y, family, _ = self.organism_arrays()
+        cells = np.full((self.grid.width, self.grid.height), -1, dtype=np.int64)
+        cells[x, y] = family
+        return cells, self.families
+
+    def print_grid(self):
+        if self.engine != "object":
+            labels, empty = padded_labels(self.world.families)
+            for row in self.world.family_grid().T:
+                print(" ".join(labels[family] if family >= 0 else empty for family in row))
+            print("")
+        else:
+            print_grid(self.grid, self.organisms, self.families)
+
+    def attach_events(self, events):
+        if self.engine == "parallel":
+            raise ValueError("the parallel engine does not emit events")
+        self.events = events
+        if self.engine == "array":
+            self.world.events = events
+
+    def track_families(self, capacity=1024):
+        # Records the family table after every step from now on.
+        if self.engine != "object":
+            raise ValueError("only the object engine keeps per-family counters")
+        self.series = FamilySeries(self.family_table, capacity)
+        return self.series
+
+    def step(self):
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.begin_step()
+        if self.engine == "array":
+            self.world.step(self.den)
+        elif self.engine == "parallel":
+            self.world.step()
+        elif self.synchronous:
+            self.organisms = self._step_synchronous()
+        else:
+            self.organisms = self._step_organisms()
+        if self.store is not None and self.store.fragmented():
+            self.store.compact(self.organisms)
+        self.step_count += 1
+        if self.series is not None:
+            self.series.record(self.step_count)
+        if profiler is not None and self.engine != "object":
+            profiler.lap("step")
+            if self.engine == "array":
+                for counter, value in self.world.counts.items():
+                    profiler.counters[counter] += value
+        for observer in self.observers:
+            observer(self)
+        if profiler is not None:
+            profiler.lap("observers")
+            # The parallel engine's workers do not report counters.
+            profiler.end_step(self, counters=self.engine != "parallel")
+
+    def should_stop(self):
+        reason = "grid full" if self.is_full() else None
+        if reason is None and self.stopping is not None:
+            reason = self.stopping.check(self)
+        if reason is not None:
+            self.stop_reason = reason
+            self.stopped_at = self.step_count
+        return reason
+
+    def states(self, steps):
+        for _ in range(steps):
+            if self.should_stop():
+                break
+            self.step()
+            yield self
+
+    def run(self, steps):
+        for _ in self.states(steps):
+            pass
+        return self.family_stats
+
+    def close(self):
+        if self.engine == "parallel":
+            self.world.close()
+
+    def _step_organisms(self):
+        grid = self.grid
+        rng = self.rng
+        table = self.family_table
+        population, strength, births, deaths = table.population, table.strength, table.births, table.deaths
+        fights, cooperations, steps = table.fights, table.cooperations, table.steps
+        labels = self.families
+        outcome = self.outcomes.outcome
+        events = self.events
+        profiler = self.profiler
+        store = self.store
+        step = self.step_count + 1
+        updated_organisms = []
+
+        resources = self.resources
+        if resources is None:
+            resources = grid.scatter_resources(self.den, rng)
+        else:
+            resources.regrow(step)
+        if profiler is not None:
+            counters = profiler.counters
+            retries = grid.placement_retries
+            profiler.lap("resources")
+
+        for organism in self.organisms:
+            family = organism.family
             organism.strength -= 1
+            strength[family] -= 1
             if organism.strength <= 0:
                 grid.remove_organism(organism.x, organism.y)
-                #print(f"Organism {organism.family} died.")
+                population[family] -= 1
+                strength[family] -= organism.strength
+                deaths[family] += 1
+                if store is not None:
+                    store.remove(organism.slot)
+                if events is not None:
+                    events.emit(step, "death", labels[family], organism.x, organism.y, organism.strength)
+                if profiler is not None:
+                    counters["deaths"] += 1
+                    profiler.lap("decay")
                 continue
 
             # Update steps for the organism's family
-            family_stats[organism.family]["steps"] += 1
+            steps[family] += 1
+            if profiler is not None:
+                profiler.lap("decay")
 
             old_x, old_y = organism.x, organism.y
-            new_x, new_y = move_organism(organism, grid)
+            new_x, new_y = move_organism(organism, grid, rng)
 
             other_organism = grid.get_organism(new_x, new_y)
+            if profiler is not None:
+                profiler.lap("move")
             if other_organism is not None:
-                interaction_type, winner = interact(organism, other_organism, generate_resource())
-                #print(f"Interaction happened between {organism.family} and {other_organism.family}: {interaction_type}")
-
-                # Update family_stats here
-                #family_stats[organism.family].setdefault(interaction_type, 0)
-                #family_stats[organism.family][interaction_type] += 1
-                #family_stats[other_organism.family].setdefault(interaction_type, 0)
-                #family_stats[other_organism.family][interaction_type] += 1
+                other_family = other_organism.family
+                resource_value = generate_resource(rng)
+                fight, attacker_wins, attacker_delta, defender_delta = outcome(
+                    family == other_family, organism.strength, other_organism.strength, resource_value
+                )
+                organism.strength += attacker_delta
+                other_organism.strength += defender_delta
+                strength[family] += attacker_delta
+                strength[other_family] += defender_delta
+                interaction_type = "fight" if fight else "cooperate"
+                winner = (organism if attacker_wins else other_organism) if fight else None
+                if events is not None:
+                    if interaction_type == "fight":
+                        loser = other_organism if winner is organism else organism
+                        events.emit(
+                            step, "fight", labels[winner.family], new_x, new_y, winner.strength,
+                            labels[loser.family], loser.strength, resource_value,
+                        )
+                    else:
+                        events.emit(
+                            step, "cooperate", labels[family], new_x, new_y, organism.strength,
+                            labels[other_family], other_organism.strength, resource_value,
+                        )
+
                 if interaction_type == "fight":
-                    family_stats[winner.family]["fights"] += 1
+                    fights[winner.family] += 1
                 else:
-                    family_stats[organism.family]["cooperations"] += 1
-                    family_stats[other_organism.family]["cooperations"] += 1
-
+                    cooperations[family] += 1
+                    cooperations[other_family] += 1
 
                 if interaction_type == "fight":
                     #print(f"Winner: {winner.family}")
@@ -189,55 +788,429 @@ def run_simulation(grid, organisms, steps, den):
                         grid.remove_organism(old_x, old_y)
                 else:
                     grid.remove_organism(old_x, old_y)
+                if profiler is not None:
+                    counters["collisions"] += 1
+                    counters["fights" if interaction_type == "fight" else "cooperations"] += 1
+                    profiler.lap("interact")
 
-            offspring = organism.reproduce()
+            before = organism.strength
+            offspring = organism.reproduce() if not grid.is_full() else None
             if offspring is not None:
-                offspring_x, offspring_y = generate_random_coordinates(grid)
-                while grid.get_organism(offspring_x, offspring_y) is not None:
-                    offspring_x, offspring_y = generate_random_coordinates(grid)
+                offspring_x, offspring_y = grid.random_free_cell(rng)
                 grid.place_organism(offspring, offspring_x, offspring_y)
                 updated_organisms.append(offspring)
-                #print(f"Organism {organism.family} reproduced at ({offspring_x}, {offspring_y})")
+                population[family] += 1
+                strength[family] += organism.strength - before + offspring.strength
+                births[family] += 1
+                if events is not None:
+                    events.emit(step, "birth", labels[family], offspring_x, offspring_y, offspring.strength)
+                if profiler is not None:
+                    counters["births"] += 1
 
             if organism.strength > 0:
                 grid.remove_organism(old_x, old_y)
                 grid.place_organism(organism, new_x, new_y)
                 updated_organisms.append(organism)
+            if profiler is not None:
+                profiler.lap("reproduce")
 
-            for resource_x, resource_y in [coord for coord, value in resources]:
-                if new_x == resource_x and new_y == resource_y:
-                    resource = next(value for coord, value in resources if coord == (resource_x, resource_y))
-                    organism.consume(resource)
-                    #print(f"Organism {organism.family} consumed resource {resource} at ({resource_x}, {resource_y})")
+            resource = resources.consume(new_x, new_y)
+            if resource:
+                before = organism.strength
+                organism.consume(resource)
+                strength[family] += organism.strength - before
+                if events is not None:
+                    events.emit(step, "consume", labels[family], new_x, new_y, organism.strength, resource=resource)
+            if profiler is not None:
+                profiler.lap("consume")
 
-        organisms = [organism for organism in updated_organisms if organism.strength > 0]
+        if profiler is not None:
+            counters["placement_retries"] += grid.placement_retries - retries
 
+        # Everything appended above is alive: survivors passed the decay check
+        # and consuming only adds strength.
+        return updated_organisms
+
+    def _step_synchronous(self):
+        # Every organism decays, picks its move and is judged against the
+        # same snapshot of the grid, so the result does not depend on the
+        # order of self.organisms. The rule is the array engine's:
+        #   1. Per target cell, the strongest mover claims it; between equally
+        #      strong movers the one arriving along the earlier direction
+        #      (topology.directions order) wins. Other movers stay put.
+        #   2. A claim on a cell that was empty moves the claimant in. A claim
+        #      on an occupied cell is settled with the outcome table, using
+        #      the strengths from the snapshot: a fight loser dies and a
+        #      winning claimant moves in; after cooperating the claimant
+        #      stays. The occupant takes part even if it is moving away.
+        #   3. Strength changes from all of an organism's interactions are
+        #      added up, then capped.
+        # Random draws happen in a fixed order (organisms by cell, claims by
+        # target cell), which is also what makes the step order-independent.
+        # Reproduction and eating follow, as in the sequential step.
+        grid = self.grid
+        rng = self.rng
+        height = grid.height
+        table = self.family_table
+        population, strength, births, deaths = table.population, table.strength, table.births, table.deaths
+        fights, cooperations, steps = table.fights, table.cooperations, table.steps
+        labels = self.families
+        outcome = self.outcomes.outcome
+        events = self.events
+        profiler = self.profiler
+        store = self.store
+        step = self.step_count + 1
+
+        resources = self.resources
+        if resources is None:
+            resources = grid.scatter_resources(self.den, rng)
+        else:
+            resources.regrow(step)
+        if profiler is not None:
+            counters = profiler.counters
+            retries = grid.placement_retries
+            profiler.lap("resources")
+
+        survivors = []
+        for organism in sorted(self.organisms, key=lambda organism: organism.x * height + organism.y):
+            family = organism.family
+            organism.strength -= 1
+            strength[family] -= 1
+            if organism.strength <= 0:
+                grid.remove_organism(organism.x, organism.y)
+                population[family] -= 1
+                strength[family] -= organism.strength
+                deaths[family] += 1
+                if store is not None:
+                    store.remove(organism.slot)
+                if events is not None:
+                    events.emit(step, "death", labels[family], organism.x, organism.y, organism.strength)
+                continue
+            steps[family] += 1
+            survivors.append(organism)
+        if profiler is not None:
+            counters["deaths"] += len(self.organisms) - len(survivors)
+            profiler.lap("decay")
+
+        count = len(directions(grid.neighbourhood))
+        claims = {}
+        for organism in survivors:
+            direction, target_x, target_y = grid.random_move(organism.x, organism.y, rng)
+            priority = organism.strength * count + count - direction
+            target = target_x * height + target_y
+            claim = claims.get(target)
+            if claim is None or priority > claim[0]:
+                claims[target] = (priority, organism)
+        if profiler is not None:
+            profiler.lap("move")
+
+        moving = []
+        dead = set()
+        gains = {}
+        # (kind, first, second, x, y, resource) per interaction, emitted once
+        # every gain is in, with the organisms' final strengths as the array
+        # engine reports them.
+        interactions = []
+        for target, (_, organism) in sorted(claims.items()):
+            target_x, target_y = divmod(target, height)
+            occupant = grid.get_organism(target_x, target_y)
+            if occupant is None:
+                moving.append((organism, target_x, target_y))
+                continue
+            resource_value = generate_resource(rng)
+            fight, attacker_wins, attacker_delta, defender_delta = outcome(
+                organism.family == occupant.family, organism.strength, occupant.strength, resource_value
+            )
+            gains[organism] = gains.get(organism, 0) + attacker_delta
+            gains[occupant] = gains.get(occupant, 0) + defender_delta
+            if fight:
+                winner, loser = (organism, occupant) if attacker_wins else (occupant, organism)
+                dead.add(loser)
+                fights[winner.family] += 1
+                if attacker_wins:
+                    moving.append((organism, target_x, target_y))
+                if events is not None:
+                    interactions.append(("fight", winner, loser, target_x, target_y, resource_value))
+            else:
+                cooperations[organism.family] += 1
+                cooperations[occupant.family] += 1
+                if events is not None:
+                    interactions.append(("cooperate", organism, occupant, target_x, target_y, resource_value))
+            if profiler is not None:
+                counters["collisions"] += 1
+                counters["fights" if fight else "cooperations"] += 1
+
+        for organism, gain in gains.items():
+            before = organism.strength
+            organism.strength = min(before + gain, MAX_STRENGTH)
+            strength[organism.family] += organism.strength - before
+        for kind, first, second, x, y, resource_value in interactions:
+            events.emit(
+                step, kind, labels[first.family], x, y, first.strength,
+                labels[second.family], second.strength, resource_value,
+            )
+        for organism in sorted(dead, key=lambda organism: organism.x * height + organism.y):
+            family = organism.family
+            grid.remove_organism(organism.x, organism.y)
+            population[family] -= 1
+            strength[family] -= organism.strength
+            deaths[family] += 1
+            if store is not None:
+                store.remove(organism.slot)
+            if events is not None:
+                events.emit(step, "death", labels[family], organism.x, organism.y, organism.strength)
+        if profiler is not None:
+            counters["deaths"] += len(dead)
+        moving = [move for move in moving if move[0] not in dead]
+        for organism, _, _ in moving:
+            grid.remove_organism(organism.x, organism.y)
+        for organism, target_x, target_y in moving:
+            grid.place_organism(organism, target_x, target_y)
+        if dead:
+            survivors = [organism for organism in survivors if organism not in dead]
+        if profiler is not None:
+            profiler.lap("interact")
+
+        offspring = []
+        for organism in survivors:
+            if grid.is_full():
+                break
+            before = organism.strength
+            child = organism.reproduce()
+            if child is None:
+                continue
+            child_x, child_y = grid.random_free_cell(rng)
+            grid.place_organism(child, child_x, child_y)
+            offspring.append(child)
+            family = organism.family
+            population[family] += 1
+            strength[family] += organism.strength - before + child.strength
+            births[family] += 1
+            if events is not None:
+                events.emit(step, "birth", labels[family], child_x, child_y, child.strength)
+        if profiler is not None:
+            counters["births"] += len(offspring)
+            profiler.lap("reproduce")
+
+        for organism in survivors:
+            resource = resources.consume(organism.x, organism.y)
+            if resource:
+                before = organism.strength
+                organism.consume(resource)
+                strength[organism.family] += organism.strength - before
+                if events is not None:
+                    events.emit(step, "consume", labels[organism.family], organism.x, organism.y, organism.strength, resource=resource)
+        if profiler is not None:
+            profiler.lap("consume")
+            counters["placement_retries"] += grid.placement_retries - retries
+
+        return survivors + offspring
+
+def run_simulation(grid, organisms, steps, den, render=True, profiler=None, synchronous=False, seed=None, rng=None):
+    simulation = Simulation.from_grid(grid, organisms, den, rng=rng, seed=seed)
+    simulation.profiler = profiler
+    simulation.synchronous = synchronous
+    play(simulation, steps, render)
+    return simulation.family_stats
+
+def play(simulation, steps, render=True, renderer=None):
+    # steps is the total to reach, so a resumed simulation only runs the rest.
+    profiler = simulation.profiler
+    for step in range(simulation.step_count, steps):
+        reason = simulation.should_stop()
+        if reason is not None:
+            if renderer is None and reason == "grid full":
+                print("\nThe grid is full. Stopping the simulation.")
+            elif renderer is None:
+                print(f"\nStopping the simulation after step {simulation.step_count}: {reason}.")
+            break
+        if profiler is not None:
+            started = profiler.clock()
+        if renderer is not None:
+            renderer.draw(simulation.occupied_cells, f"Step {step + 1}  population {simulation.population()}")
+        elif render:
+            print(f"\nStep {step + 1}")
+            simulation.print_grid()
+        if profiler is not None:
+            profiler.add("render", profiler.clock() - started)
+        simulation.step()
+
+    if renderer is not None:
+        status = f"Step {simulation.step_count}  population {simulation.population()}"
+        if simulation.stop_reason == "grid full":
+            status += "  (the grid is full)"
+        elif simulation.stop_reason is not None:
+            status += f"  (stopped: {simulation.stop_reason})"
+        renderer.draw(simulation.occupied_cells(), status, force=True)
+        renderer.close()
     print("\nSimulation Ended")
-    print_family_stats(family_stats, steps)
+    print_family_stats(simulation.family_stats, steps)
+
+def resource_count(width, height, density):
+    return round((width * height) * (density / 100))
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Simulate co-operation and competition among organisms.")
+    parser.add_argument("-x", "--width", type=int, default=100, help="grid width (default: 100)")
+    parser.add_argument("-y", "--height", type=int, default=60, help="grid height (default: 60)")
+    parser.add_argument("-s", "--steps", type=int, default=500, help="number of simulation steps (default: 500)")
+    parser.add_argument("-d", "--density", type=int, default=30, help="resource density 0-100 (default: 30)")
+    parser.add_argument("--seed", type=int, help="random seed for a reproducible run")
+    parser.add_argument("--replicate", type=int, help="with --seed, rerun this replicate of a sweep")
+    parser.add_argument("--engine", choices=["object", "array", "parallel"], default="object", help="step engine (default: object)")
+    parser.add_argument("--workers", type=int, help="worker processes for --engine parallel (default: all cores)")
+    parser.add_argument("--families", type=int, default=len(FAMILIES), help="number of families (default: 5)")
+    parser.add_argument("--topology", choices=["bounded", "torus"], default="bounded", help="grid edges, or wrap around (default: bounded)")
+    parser.add_argument("--neighbourhood", choices=["von-neumann", "moore"], default="von-neumann", help="4 or 8 neighbouring cells to move to (default: von-neumann)")
+    parser.add_argument("--sparse", action="store_true", help="store only the occupied parts of the grid (object engine)")
+    parser.add_argument("--store", action="store_true", help="keep organisms as rows of a population store, reusing dead organisms' slots (object engine)")
+    parser.add_argument("--synchronous", action="store_true", help="update every organism against the same snapshot of the grid, independent of list order (object engine; the others always do)")
+    parser.add_argument("--persistent-resources", action="store_true", help="keep uneaten resources between steps instead of scattering fresh ones (object and array engines)")
+    parser.add_argument("--regrowth", type=float, default=0.05, help="with --persistent-resources, chance per step that an eaten cell grows a new resource (default: 0.05)")
+    parser.add_argument("--no-render", action="store_true", help="do not print the grid every step")
+    parser.add_argument("--ansi", action="store_true", help="redraw only changed cells in place instead of printing every grid")
+    parser.add_argument("--fps", type=float, help="with --ansi, draw at most this many frames per second")
+    parser.add_argument("--json", action="store_true", help="print only the final family stats, as JSON")
+    parser.add_argument("--events", help="record events to a .csv file or a directory of .npz chunks")
+    parser.add_argument("--event-kinds", nargs="+", help="only record these kinds (birth, death, fight, cooperate, consume)")
+    parser.add_argument("--checkpoint", help="write checkpoints to this .npz path ({step} is replaced by the step)")
+    parser.add_argument("--checkpoint-every", type=int, default=1000, help="steps between checkpoints (default: 1000)")
+    parser.add_argument("--image", help="write an image of the grid to this .png or .ppm path ({step} is replaced by the step)")
+    parser.add_argument("--image-every", type=int, default=100, help="steps between images (default: 100)")
+    parser.add_argument("--image-scale", type=int, default=1, help="cells per image pixel along each side (default: 1)")
+    parser.add_argument("--metrics", help="write a JSON line of per-phase timings and counters for every step to this file")
+    parser.add_argument("--metrics-port", type=int, help="serve Prometheus-style metrics at http://127.0.0.1:PORT/metrics")
+    parser.add_argument("--trace-memory", action="store_true", help="with --metrics or --metrics-port, record traced memory per step")
+    parser.add_argument("--memory-snapshot-every", type=int, default=0, metavar="N", help="with --trace-memory, add the top allocation sites to every Nth step's record (default: never)")
+    parser.add_argument("--family-series", help="save per-family population, strength, births, deaths, fights and cooperations after every step to this .npz file (object engine)")
+    parser.add_argument("--stream", help="publish grid snapshots and family stats on HOST:PORT or a Unix socket path (watch with python stream.py)")
+    parser.add_argument("--stream-every", type=int, default=1, help="steps between streamed snapshots (default: 1)")
+    parser.add_argument("--history", help="record every step to this file as keyframes and deltas (replay with python history.py)")
+    parser.add_argument("--keyframe-every", type=int, default=1000, help="with --history, steps between full keyframes (default: 1000)")
+    parser.add_argument("--resume", help="continue from a checkpoint; --steps is the total to reach")
+    stopping.add_arguments(parser)
+    seeding.add_arguments(parser)
+    return parser
+
+def check_family_series(parser, args, engine):
+    if args.family_series and engine != "object":
+        parser.error("--family-series needs the object engine; the other engines keep no per-family counters")
 
-    Gx = int(input("Grid X size [number only]: "))
-    Gy = int(input("Grid Y size [number only]: "))
-    Rounds = int(input("Enter number of simulation steps [number only]: "))
-    RDensityP = int(input("Enter resource density 0-100 [number only]: "))
-    Rden = round((Gx * Gy) * (RDensityP / 100))
-    print(Gx, Gy, Rounds, Rden)
-    grid = Grid(Gx, Gy)
-    organisms = place_initial_organisms(grid)
-    run_simulation(grid, organisms, Rounds, Rden)
+def parse_args(argv=None, parser=None):
+    parser = parser if parser is not None else build_parser()
+    args = parser.parse_args(argv)
+    if not args.resume:
+        check_family_series(parser, args, args.engine)
+    return args
 
+def main(argv=None):
+    parser = build_parser()
+    args = parse_args(argv, parser)
+    den = resource_count(args.width, args.height, args.density)
+    if args.resume:
+        import checkpoint
 
+        simulation = checkpoint.load(args.resume)
+        # --engine does not apply to a resumed run; the checkpoint's does.
+        check_family_series(parser, args, simulation.engine)
+        args.width, args.height, den = simulation.width, simulation.height, simulation.den
+    else:
+        seed = args.seed
+        if args.replicate is not None:
+            seed = replicate_seed(seed, args.replicate)
+        simulation = Simulation(
+            args.width, args.height, den, engine=args.engine, seed=seed, workers=args.workers, sparse=args.sparse,
+            topology=args.topology, neighbourhood=args.neighbourhood, families=family_labels(args.families),
+            persistent_resources=args.persistent_resources, regrowth=args.regrowth, synchronous=args.synchronous,
+            seeding=seeding.from_args(args), store=args.store,
+        )
+    try:
+        simulate(simulation, args, den)
+    finally:
+        simulation.close()
 
-Gx = int(input("Grid X size [number only]: "))
-Gy = int(input("Grid Y size [number only]: "))
-Rounds = int(input("Enter number of simulation steps [number only]: "))
-RDensityP = int(input("Enter resource density 0-100 [number only]: "))
-Rden = round((Gx * Gy) * (RDensityP / 100))
-print(Gx, Gy, Rounds, Rden)
-grid = Grid(Gx, Gy)
-organisms = place_initial_organisms(grid)
-run_simulation(grid, organisms, Rounds, Rden)
+def simulate(simulation, args, den):
+    events = None
+    if args.events:
+        from events import EventStream, open_writer
 
+        events = EventStream()
+        events.subscribe(open_writer(args.events), args.event_kinds)
+        simulation.attach_events(events)
+    checkpointer = None
+    if args.checkpoint:
+        import checkpoint
+
+        checkpointer = checkpoint.Checkpointer(args.checkpoint, args.checkpoint_every)
+        simulation.observers.append(checkpointer)
+    if args.image:
+        from images import ImageExporter
+
+        simulation.observers.append(ImageExporter(args.image, args.image_every, args.image_scale))
+    profiler = server = None
+    if args.metrics or args.metrics_port is not None:
+        from metrics import MetricsServer, Profiler
+
+        profiler = Profiler(
+            open(args.metrics, "w") if args.metrics else None, memory=args.trace_memory,
+            snapshot_every=args.memory_snapshot_every,
+        )
+        simulation.profiler = profiler
+        if args.metrics_port is not None:
+            server = MetricsServer(profiler, args.metrics_port)
+    simulation.stopping = stopping.from_args(args)
+    series = None
+    if args.family_series:
+        series = simulation.track_families(max(args.steps - simulation.step_count, 1))
+    recorder = None
+    if args.history:
+        from history import HistoryRecorder
+
+        recorder = HistoryRecorder(args.history, args.keyframe_every)
+        recorder.start(simulation)
+        simulation.observers.append(recorder)
+    streamer = None
+    if args.stream:
+        from stream import SnapshotServer, parse_address
+
+        streamer = SnapshotServer(parse_address(args.stream), args.stream_every)
+        simulation.observers.append(streamer)
+    if args.json:
+        simulation.run(args.steps - simulation.step_count)
+        print(json.dumps({
+            "steps": simulation.step_count,
+            "stop_reason": simulation.stop_reason,
+            "stopped_at": simulation.stopped_at,
+            "family_stats": simulation.family_stats,
+        }))
+    else:
+        renderer = None
+        if args.ansi and not args.no_render:
+            from render import TerminalRenderer
+
+            renderer = TerminalRenderer(
+                args.width, args.height, max_fps=args.fps, cell_width=max(len(label) for label in simulation.families),
+            )
+        else:
+            print(args.width, args.height, args.steps, den)
+        play(simulation, args.steps, render=not args.no_render, renderer=renderer)
+    if series is not None:
+        series.save(args.family_series)
+    if checkpointer is not None:
+        checkpointer.close()
+    if events is not None:
+        events.close()
+    if recorder is not None:
+        recorder.close()
+    if streamer is not None:
+        streamer.close()
+    if server is not None:
+        server.close()
+    if profiler is not None:
+        profiler.close()
 
+if __name__ == "__main__":
+    main()
 
 #for family, stats in family_stats.items():
     #print(f"Family {family}:")
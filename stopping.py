@@ -0,0 +1,75 @@
+import time
+from collections import deque
+
+REASONS = ("grid full", "extinct", "dominance", "steady state", "time budget", "step budget")
+
+
+class Stopper:
+    # Ends a run early once one of the enabled criteria holds, checked before
+    # every step:
+    #   extinct       no organism is left
+    #   dominance     only one family is left
+    #   steady state  the population stayed within `tolerance` (a fraction of
+    #                 the window's largest population) for `window` steps
+    #   time budget   `seconds` of wall-clock time since the first check
+    #   step budget   `steps` steps since the first check
+    # check() returns the reason, or None to keep going.
+    def __init__(self, extinction=True, dominance=False, window=0, tolerance=0.0, seconds=None, steps=None, clock=time.perf_counter):
+        self.extinction = extinction
+        self.dominance = dominance
+        self.tolerance = tolerance
+        self.seconds = seconds
+        self.steps = steps
+        self.clock = clock
+        self.window = deque(maxlen=window) if window else None
+        self.started = None
+        self.first_step = None
+
+    def check(self, simulation):
+        if self.started is None:
+            self.started = self.clock()
+            self.first_step = simulation.step_count
+        population = simulation.population()
+        if self.extinction and not population:
+            return "extinct"
+        if self.dominance and sum(1 for count in simulation.family_populations() if count) <= 1:
+            return "dominance"
+        window = self.window
+        if window is not None:
+            window.append(population)
+            if len(window) == window.maxlen and max(window) - min(window) <= self.tolerance * max(window):
+                return "steady state"
+        if self.seconds is not None and self.clock() - self.started >= self.seconds:
+            return "time budget"
+        if self.steps is not None and simulation.step_count - self.first_step >= self.steps:
+            return "step budget"
+        return None
+
+
+def add_arguments(parser):
+    group = parser.add_argument_group("stopping early")
+    group.add_argument("--stop-on", nargs="+", choices=["extinction", "dominance"], default=[], help="end the run once every organism has died, or once only one family is left")
+    group.add_argument("--steady-window", type=int, default=0, help="end the run once the population has held steady for this many steps")
+    group.add_argument("--steady-tolerance", type=float, default=0.01, help="largest change, as a fraction of the population, that counts as steady (default: 0.01)")
+    group.add_argument("--time-budget", type=float, help="end the run after this many seconds")
+    group.add_argument("--step-budget", type=int, help="end the run after this many steps")
+
+
+def options(args):
+    # Stopper keyword arguments for the options add_arguments() defined, or
+    # None if none of them is set.
+    if not (args.stop_on or args.steady_window or args.time_budget is not None or args.step_budget is not None):
+        return None
+    return {
+        "extinction": "extinction" in args.stop_on,
+        "dominance": "dominance" in args.stop_on,
+        "window": args.steady_window,
+        "tolerance": args.steady_tolerance,
+        "seconds": args.time_budget,
+        "steps": args.step_budget,
+    }
+
+
+def from_args(args):
+    settings = options(args)
+    return Stopper(**settings) if settings is not None else None
@@ -0,0 +1,237 @@
+import argparse
+import asyncio
+import json
+import os
+import struct
+import sys
+import threading
+import zlib
+
+import numpy as np
+
+# A frame is HEADER followed by `length` bytes: a JSON object of `header`
+# bytes, then the zlib-compressed grid. Grid cells hold the family index plus
+# one (0 for an empty cell), as uint8, or uint16 once there are more than 254
+# families. The JSON carries the family labels, the population and family
+# stats: with FULL set, the stats of every family; otherwise only those of
+# families whose stats changed since the previous frame.
+MAGIC = b"LSIM"
+HEADER = struct.Struct("<4sIQIIBI")
+FULL = 1
+
+
+class Snapshot:
+    # One step's state, encoded once and shared by every client. The grid is
+    # compressed on the stepping thread; the two possible frames (full stats
+    # or changes only) are built the first time a client needs them.
+    def __init__(self, step, width, height, labels, population, stats, changed, grid):
+        self.step = step
+        self.width = width
+        self.height = height
+        self.labels = labels
+        self.population = population
+        self.stats = stats
+        self.changed = changed
+        self.grid = grid
+        self.frames = {}
+
+    def frame(self, full):
+        encoded = self.frames.get(full)
+        if encoded is None:
+            stats = self.stats if full else {family: self.stats[family] for family in self.changed}
+            header = json.dumps({"labels": self.labels, "population": self.population, "family_stats": stats}).encode()
+            encoded = HEADER.pack(
+                MAGIC, len(header) + len(self.grid), self.step, self.width, self.height, FULL if full else 0, len(header)
+            ) + header + self.grid
+            self.frames[full] = encoded
+        return encoded
+
+
+def take_snapshot(simulation, previous_stats):
+    family_grid, labels = simulation.family_grid()
+    dtype = np.uint8 if len(labels) < 255 else np.uint16
+    grid = zlib.compress((family_grid + 1).astype(dtype).tobytes(), 1)
+    stats = {family: dict(values) for family, values in simulation.family_stats.items()}
+    changed = [family for family, values in stats.items() if previous_stats.get(family) != values]
+    return Snapshot(
+        simulation.step_count, simulation.width, simulation.height, list(labels), simulation.population(),
+        stats, changed, grid,
+    )
+
+
+def decode_frame(header, body):
+    magic, length, step, width, height, flags, header_length = HEADER.unpack(header)
+    if magic != MAGIC:
+        raise ValueError("not a life-sim frame")
+    meta = json.loads(body[:header_length])
+    dtype = np.uint8 if len(meta["labels"]) < 255 else np.uint16
+    cells = np.frombuffer(zlib.decompress(body[header_length:]), dtype=dtype).reshape(width, height)
+    meta.update(step=step, width=width, height=height, full=bool(flags & FULL))
+    return meta, cells.astype(np.int64) - 1
+
+
+async def read_frame(reader):
+    # Returns (meta, family grid) for the next frame, as sent by SnapshotServer.
+    header = await reader.readexactly(HEADER.size)
+    length = HEADER.unpack(header)[1]
+    return decode_frame(header, await reader.readexactly(length))
+
+
+class Client:
+    # Holds at most one frame that has not been handed to the socket yet. A
+    # newer snapshot replaces it, and the client is then sent full stats, since
+    # it missed the changes carried by the dropped frame.
+    def __init__(self, writer):
+        self.writer = writer
+        self.pending = None
+        self.ready = asyncio.Event()
+        self.stale = True
+
+    def offer(self, snapshot):
+        # Returns whether an unsent frame was dropped.
+        dropped = self.pending is not None
+        if dropped:
+            self.stale = True
+        self.pending = snapshot
+        self.ready.set()
+        return dropped
+
+    async def send(self):
+        while True:
+            await self.ready.wait()
+            self.ready.clear()
+            snapshot, self.pending = self.pending, None
+            full, self.stale = self.stale, False
+            self.writer.write(snapshot.frame(full))
+            await self.writer.drain()
+
+
+class SnapshotServer:
+    # Observer that publishes a snapshot of the grid and family stats every
+    # `every` steps to the clients connected on a TCP port (address is a
+    # (host, port) pair) or a Unix socket (address is a path). The server runs
+    # its own event loop on a daemon thread. A step with no clients returns
+    # straight away; otherwise the snapshot is encoded once on the stepping
+    # thread and handed to every client. A client whose socket cannot keep up
+    # has frames dropped, so the simulation never waits for it.
+    def __init__(self, address, every=1):
+        self.address = address
+        self.every = every
+        self.clients = set()
+        self.tasks = set()
+        self.previous_stats = {}
+        self.published = 0
+        # Frames dropped over all clients, past and present. Only the loop
+        # thread updates it, so other threads can read it as it is.
+        self.dropped = 0
+        self.loop = asyncio.new_event_loop()
+        started = threading.Event()
+        self.thread = threading.Thread(target=self._serve, args=(started,), daemon=True)
+        self.thread.start()
+        started.wait()
+        if self.error is not None:
+            raise self.error
+
+    def __call__(self, simulation):
+        if not self.clients or simulation.step_count % self.every:
+            return
+        snapshot = take_snapshot(simulation, self.previous_stats)
+        self.previous_stats = snapshot.stats
+        self.published += 1
+        self.loop.call_soon_threadsafe(self._publish, snapshot)
+
+    def _serve(self, started):
+        asyncio.set_event_loop(self.loop)
+        self.error = None
+        try:
+            if isinstance(self.address, str):
+                self.server = self.loop.run_until_complete(asyncio.start_unix_server(self._connected, self.address))
+            else:
+                host, port = self.address
+                self.server = self.loop.run_until_complete(asyncio.start_server(self._connected, host, port))
+        except OSError as error:
+            self.error = error
+            started.set()
+            self.loop.close()
+            return
+        started.set()
+        self.loop.run_forever()
+        self.loop.close()
+
+    async def _connected(self, reader, writer):
+        client = Client(writer)
+        self.clients.add(client)
+        self.tasks.add(asyncio.current_task())
+        try:
+            await client.send()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self.clients.discard(client)
+            self.tasks.discard(asyncio.current_task())
+            writer.close()
+
+    async def _shutdown(self):
+        self.server.close()
+        for task in list(self.tasks):
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        await self.server.wait_closed()
+
+    def _publish(self, snapshot):
+        for client in self.clients:
+            self.dropped += client.offer(snapshot)
+
+    @property
+    def port(self):
+        return self.server.sockets[0].getsockname()[1]
+
+    def close(self):
+        if self.thread.is_alive():
+            asyncio.run_coroutine_threadsafe(self._shutdown(), self.loop).result()
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+            if isinstance(self.address, str):
+                os.unlink(self.address)
+
+
+def parse_address(value):
+    # HOST:PORT or :PORT for TCP, anything else is a Unix socket path.
+    host, separator, port = value.rpartition(":")
+    if separator and port.isdigit():
+        return host or "127.0.0.1", int(port)
+    return value
+
+
+async def watch(address, out=sys.stdout):
+    if isinstance(address, str):
+        reader, writer = await asyncio.open_unix_connection(address)
+    else:
+        reader, writer = await asyncio.open_connection(*address)
+    stats = {}
+    try:
+        while True:
+            meta, _ = await read_frame(reader)
+            if meta["full"]:
+                stats = {}
+            stats.update(meta["family_stats"])
+            out.write(f"step {meta['step']}  population {meta['population']}  {json.dumps(stats)}\n")
+            out.flush()
+    except asyncio.IncompleteReadError:
+        pass
+    finally:
+        writer.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Print the step, population and family stats streamed by sim.py --stream.")
+    parser.add_argument("address", type=parse_address, help="HOST:PORT, :PORT or a Unix socket path")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(watch(args.address))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
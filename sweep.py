@@ -0,0 +1,234 @@
+import argparse
+import csv
+import itertools
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import stopping
+from sim import Simulation, replicate_seed, resource_count
+
+COLUMNS = [
+    "width", "height", "density", "seed", "replicate", "engine", "status", "steps_run", "seconds",
+    "family", "steps", "fights", "cooperations",
+]
+
+
+def parameter_grid(sizes, densities, replicates, seed=0, steps=500, engine="object", stop=None):
+    # stop holds stopping.Stopper options for every run, or None.
+    tasks = []
+    for (width, height), density, replicate in itertools.product(sizes, densities, range(replicates)):
+        tasks.append({
+            "width": width,
+            "height": height,
+            "density": density,
+            "seed": seed,
+            "replicate": replicate,
+            "steps": steps,
+            "engine": engine,
+            "stop": stop,
+        })
+    return tasks
+
+
+def run_task(task, timeout=None):
+    # The timeout is checked between steps, so a worker that runs out of time
+    # still reports the stats it collected and the pool keeps its process.
+    started = time.perf_counter()
+    den = resource_count(task["width"], task["height"], task["density"])
+    seed = replicate_seed(task["seed"], task["replicate"])
+    simulation = Simulation(task["width"], task["height"], den, engine=task["engine"], seed=seed)
+    if task.get("stop"):
+        simulation.stopping = stopping.Stopper(**task["stop"])
+    status = "completed"
+    for _ in simulation.states(task["steps"]):
+        if timeout is not None and time.perf_counter() - started > timeout:
+            status = "timeout"
+            break
+    if simulation.stop_reason is not None:
+        status = simulation.stop_reason
+    elif status == "completed" and simulation.is_full():
+        status = "grid full"
+    seconds = time.perf_counter() - started
+
+    rows = []
+    for family, stats in simulation.family_stats.items():
+        rows.append({
+            "width": task["width"],
+            "height": task["height"],
+            "density": task["density"],
+            "seed": task["seed"],
+            "replicate": task["replicate"],
+            "engine": task["engine"],
+            "status": status,
+            "steps_run": simulation.step_count,
+            "seconds": round(seconds, 4),
+            "family": family,
+            "steps": stats["steps"],
+            "fights": stats["fights"],
+            "cooperations": stats["cooperations"],
+        })
+    return rows
+
+
+def run_ensemble_task(tasks, timeout=None):
+    # Runs replicates that differ only in their replicate number as one
+    # EnsembleWorld. Each run's seconds are its share of the batch's time.
+    from ensemble import EnsembleWorld
+
+    started = time.perf_counter()
+    first = tasks[0]
+    den = resource_count(first["width"], first["height"], first["density"])
+    seeds = [replicate_seed(task["seed"], task["replicate"]) for task in tasks]
+    world = EnsembleWorld(first["width"], first["height"], den, seeds)
+    world.place_initial()
+    timed_out = False
+    for _ in range(first["steps"]):
+        if timeout is not None and time.perf_counter() - started > timeout:
+            timed_out = True
+            break
+        world.retire_full()
+        if not world.active.any():
+            break
+        world.step()
+    world.retire_full()
+    seconds = (time.perf_counter() - started) / len(tasks)
+
+    rows = []
+    for replicate, task in enumerate(tasks):
+        status = "timeout" if timed_out else "completed"
+        if world.full()[replicate]:
+            status = "grid full"
+        for family, stats in world.family_stats(replicate).items():
+            rows.append({
+                "width": task["width"],
+                "height": task["height"],
+                "density": task["density"],
+                "seed": task["seed"],
+                "replicate": task["replicate"],
+                "engine": task["engine"],
+                "status": status,
+                "steps_run": int(world.steps_run[replicate]),
+                "seconds": round(seconds, 4),
+                "family": family,
+                "steps": stats["steps"],
+                "fights": stats["fights"],
+                "cooperations": stats["cooperations"],
+            })
+    return rows
+
+
+def error_rows(tasks):
+    # What a run that raised reports: its parameters and status "error".
+    return [
+        {
+            "width": task["width"],
+            "height": task["height"],
+            "density": task["density"],
+            "seed": task["seed"],
+            "replicate": task["replicate"],
+            "engine": task["engine"],
+            "status": "error",
+            "steps_run": 0,
+            "seconds": "",
+            "family": "",
+            "steps": "",
+            "fights": "",
+            "cooperations": "",
+        }
+        for task in tasks
+    ]
+
+
+def ensemble_batches(tasks, batch):
+    groups = {}
+    for task in tasks:
+        key = (task["width"], task["height"], task["density"], task["seed"], task["steps"])
+        groups.setdefault(key, []).append(task)
+    return [group[i:i + batch] for group in groups.values() for i in range(0, len(group), batch)]
+
+
+def sweep(tasks, workers=None, timeout=None, progress=None, batch=256, errors=sys.stderr):
+    # Ensemble tasks run batch replicates at a time in one process. A run
+    # that raises is reported as an "error" row (and its exception written to
+    # errors) rather than ending the sweep.
+    rows = []
+    single = [task for task in tasks if task["engine"] != "ensemble"]
+    batches = ensemble_batches([task for task in tasks if task["engine"] == "ensemble"], batch)
+    done = 0
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        futures = {pool.submit(run_task, task, timeout): [task] for task in single}
+        futures.update({pool.submit(run_ensemble_task, group, timeout): group for group in batches})
+        for future in as_completed(futures):
+            group = futures[future]
+            try:
+                rows.extend(future.result())
+            except Exception as error:
+                rows.extend(error_rows(group))
+                if errors is not None:
+                    for task in group:
+                        errors.write(f"run {task['width']}x{task['height']} density {task['density']} replicate {task['replicate']} failed: {error!r}\n")
+            done += len(group)
+            if progress is not None:
+                progress(done, len(tasks))
+    rows.sort(key=lambda row: (row["width"], row["height"], row["density"], row["replicate"], row["family"]))
+    return rows
+
+
+def write_rows(rows, out):
+    writer = csv.DictWriter(out, fieldnames=COLUMNS)
+    writer.writeheader()
+    writer.writerows(rows)
+
+
+def progress_printer(out=sys.stderr):
+    started = time.perf_counter()
+
+    def progress(done, total):
+        out.write(f"\r{done}/{total} runs, {time.perf_counter() - started:.1f}s")
+        if done == total:
+            out.write("\n")
+        out.flush()
+
+    return progress
+
+
+def parse_size(value):
+    width, _, height = value.partition("x")
+    return int(width), int(height)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run simulations over a grid of parameters in parallel.")
+    parser.add_argument("--size", type=parse_size, nargs="+", default=[(100, 60)], help="grid sizes as WxH (default: 100x60)")
+    parser.add_argument("--density", type=int, nargs="+", default=[30], help="resource densities 0-100 (default: 30)")
+    parser.add_argument("--replicates", type=int, default=1, help="runs per size and density (default: 1)")
+    parser.add_argument("--seed", type=int, default=0, help="root seed; replicate i runs on stream i spawned from it (default: 0)")
+    parser.add_argument("--steps", type=int, default=500, help="steps per run (default: 500)")
+    parser.add_argument("--engine", choices=["object", "array", "ensemble"], default="object", help="step engine (default: object)")
+    parser.add_argument("--batch", type=int, default=256, help="replicates per process for --engine ensemble (default: 256)")
+    parser.add_argument("--workers", type=int, help="worker processes (default: all cores)")
+    parser.add_argument("--timeout", type=float, help="seconds allowed per run")
+    parser.add_argument("--out", help="CSV file for the results (default: stdout)")
+    parser.add_argument("--quiet", action="store_true", help="do not report progress")
+    stopping.add_arguments(parser)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    stop = stopping.options(args)
+    if stop is not None and args.engine == "ensemble":
+        raise SystemExit("--engine ensemble does not stop early; an extinct replicate already costs nothing per step")
+    tasks = parameter_grid(args.size, args.density, args.replicates, args.seed, args.steps, args.engine, stop)
+    rows = sweep(tasks, args.workers, args.timeout, None if args.quiet else progress_printer(), args.batch)
+    if args.out:
+        with open(args.out, "w", newline="") as out:
+            write_rows(rows, out)
+    else:
+        write_rows(rows, sys.stdout)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+
+import checkpoint
+from seeding import Seeding
+from sim import Simulation
+
+SETUPS = {
+    "object": {},
+    "sparse": {"sparse": True},
+    "array": {"engine": "array"},
+    "persistent": {"persistent_resources": True, "regrowth": 0.2},
+    "array-persistent": {"engine": "array", "persistent_resources": True, "regrowth": 0.2},
+    "synchronous": {"synchronous": True},
+    "store": {"store": True},
+}
+
+
+def state(simulation):
+    return [array.tolist() for array in simulation.organism_arrays()], simulation.family_stats, simulation.step_count
+
+
+@pytest.mark.parametrize("setup", SETUPS)
+def test_loaded_checkpoint_continues_bit_for_bit(setup, tmp_path):
+    simulation = Simulation(40, 30, 100, seed=11, seeding=Seeding(20, "3-9"), **SETUPS[setup])
+    simulation.run(6)
+    path = str(tmp_path / "state.npz")
+    checkpoint.save(simulation, path)
+    loaded = checkpoint.load(path)
+    assert state(loaded) == state(simulation)
+    for _ in range(10):
+        simulation.step()
+        loaded.step()
+        assert state(loaded) == state(simulation)
+    if setup.startswith("array"):
+        assert np.array_equal(loaded.world.occupant, simulation.world.occupant)
@@ -0,0 +1,71 @@
+import random
+
+import numpy as np
+import pytest
+
+from engine import ArrayWorld
+from sim import Grid, Organism, Simulation
+
+
+class FixedResource(random.Random):
+    # Every collision is over a resource worth 2.
+    def randint(self, a, b):
+        return 2
+
+
+class FixedResourceGenerator:
+    def __init__(self, seed):
+        self.generator = np.random.default_rng(seed)
+
+    def integers(self, low, high=None, size=None):
+        return np.full(size, 2, dtype=np.int64)
+
+    def __getattr__(self, name):
+        return getattr(self.generator, name)
+
+
+@pytest.mark.parametrize("topology, neighbourhood", [
+    ("bounded", "von-neumann"),
+    ("bounded", "moore"),
+    ("torus", "von-neumann"),
+    ("torus", "moore"),
+])
+def test_array_engine_applies_the_synchronous_rule(topology, neighbourhood):
+    # Both engines step from the same crowded start with the same moves and
+    # no resources. Strengths stay below the reproduction threshold, so
+    # every collision and its outcome has to match.
+    layout = random.Random(5)
+    for _ in range(30):
+        grid = Grid(6, 5, topology, neighbourhood)
+        organisms = []
+        for cell in layout.sample(range(30), 20):
+            organism = Organism(layout.randrange(3), layout.randint(1, 4))
+            grid.place_organism(organism, *divmod(cell, 5))
+            organisms.append(organism)
+        moves = {}
+        for organism in organisms:
+            direction, dx, dy = layout.choice(grid.open_moves(organism.x, organism.y))
+            moves[organism.x, organism.y] = direction
+
+        world = ArrayWorld.from_grid(grid, organisms, FixedResourceGenerator(0), families=["A", "B", "C"])
+        world.choose_moves = lambda: np.array([moves[x, y] for x, y in zip(world.x.tolist(), world.y.tolist())])
+        world.step(0)
+
+        simulation = Simulation.from_grid(grid, organisms, 0, rng=FixedResource(0), families=["A", "B", "C"])
+        simulation.synchronous = True
+        open_moves = grid.open_moves
+        grid.random_move = lambda x, y, rng: next(
+            (direction, *grid._target(x, y, dx, dy)) for direction, dx, dy in open_moves(x, y) if direction == moves[x, y]
+        )
+        simulation.step()
+
+        x, y, family, strength = simulation.organism_arrays()
+        expected = sorted(zip(x.tolist(), y.tolist(), family.tolist(), strength.tolist()))
+        assert sorted(zip(world.x.tolist(), world.y.tolist(), world.family.tolist(), world.strength.tolist())) == expected
+        assert world.family_stats() == simulation.family_stats
+
+
+def test_place_initial_rejects_more_families_than_cells():
+    world = ArrayWorld(10, 5, [str(family) for family in range(300)], np.random.default_rng(0))
+    with pytest.raises(ValueError, match="300 organisms do not fit on a 10x5 grid"):
+        world.place_initial()
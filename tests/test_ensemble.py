@@ -0,0 +1,26 @@
+import numpy as np
+import pytest
+
+from ensemble import EnsembleWorld
+
+
+def organisms(world, replicate):
+    mine = world.replicate == replicate
+    return sorted(zip(world.x[mine].tolist(), world.y[mine].tolist(), world.family[mine].tolist(), world.strength[mine].tolist()))
+
+
+@pytest.mark.parametrize("topology", ["bounded", "torus"])
+def test_replicate_runs_the_same_alone_and_in_a_batch(topology):
+    # A small grid, so some replicates fill up and retire partway through.
+    seeds = [11, 3, 7, 42, 5]
+    batch = EnsembleWorld(6, 5, 5, seeds, topology=topology)
+    batch.place_initial()
+    batch.run(20)
+    assert 0 < np.count_nonzero(batch.full()) < len(seeds)
+    for index, seed in enumerate(seeds):
+        alone = EnsembleWorld(6, 5, 5, [seed], topology=topology)
+        alone.place_initial()
+        alone.run(20)
+        assert alone.steps_run[0] == batch.steps_run[index]
+        assert alone.family_stats(0) == batch.family_stats(index)
+        assert organisms(alone, 0) == organisms(batch, index)
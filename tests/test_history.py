@@ -0,0 +1,47 @@
+import random
+
+import numpy as np
+
+from history import History, HistoryRecorder, Replay
+from seeding import Seeding
+from sim import Simulation
+
+
+def grids(simulation):
+    x, y, family, strength = simulation.organism_arrays()
+    family_grid = np.full((simulation.width, simulation.height), -1, dtype=np.int64)
+    strength_grid = np.zeros((simulation.width, simulation.height), dtype=np.int64)
+    family_grid[x, y] = family
+    strength_grid[x, y] = strength
+    return family_grid, strength_grid
+
+
+def test_replay_matches_recorded_grids(tmp_path):
+    path = str(tmp_path / "run.history")
+    simulation = Simulation(30, 20, 150, seed=5, synchronous=True, seeding=Seeding(15, "3-9"))
+    recorder = HistoryRecorder(path, keyframe_every=4)
+    recorder.start(simulation)
+    simulation.observers.append(recorder)
+    expected = {simulation.step_count: grids(simulation)}
+    for state in simulation.states(25):
+        expected[state.step_count] = grids(state)
+    recorder.close()
+
+    history = History(path)
+    try:
+        assert (history.first_step, history.last_step) == (0, simulation.step_count)
+        replay = Replay(history)
+        # Forward and back over the whole run, then jumps in both directions.
+        steps = list(expected) + list(reversed(list(expected)))
+        steps += random.Random(1).choices(list(expected), k=30)
+        for step in steps:
+            replay.seek(step)
+            family, strength = replay.grids()
+            assert np.array_equal(family, expected[step][0])
+            assert np.array_equal(strength, expected[step][1])
+        replay.seek(history.last_step)
+        while replay.back():
+            assert np.array_equal(replay.grids()[0], expected[replay.step][0])
+        assert replay.step == history.first_step
+    finally:
+        history.close()
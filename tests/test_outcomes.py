@@ -0,0 +1,31 @@
+import itertools
+
+import numpy as np
+
+from outcomes import DEFAULT_OUTCOMES, MAX_RESOURCE, MAX_STRENGTH
+from sim import Organism, interact
+
+COLLISIONS = list(itertools.product(
+    (False, True), range(MAX_STRENGTH + 1), range(MAX_STRENGTH + 1), range(1, MAX_RESOURCE + 1),
+))
+
+
+def test_table_matches_interact():
+    for same_family, attacker_strength, defender_strength, resource_value in COLLISIONS:
+        attacker = Organism(0 if same_family else 1, attacker_strength)
+        defender = Organism(0, defender_strength)
+        interaction, winner = interact(attacker, defender, resource_value)
+        expected = (
+            interaction == "fight",
+            winner is attacker,
+            attacker.strength - attacker_strength,
+            defender.strength - defender_strength,
+        )
+        assert DEFAULT_OUTCOMES.outcome(same_family, attacker_strength, defender_strength, resource_value) == expected
+
+
+def test_gather_matches_outcome():
+    columns = [np.array(column) for column in zip(*COLLISIONS)]
+    gathered = DEFAULT_OUTCOMES.gather(*columns)
+    for i, collision in enumerate(COLLISIONS):
+        assert tuple(array[i].item() for array in gathered) == DEFAULT_OUTCOMES.outcome(*collision)
@@ -0,0 +1,116 @@
+import numpy as np
+import pytest
+
+from engine import DIRECTIONS, FIGHTS, COOPERATIONS
+from outcomes import MAX_STRENGTH, default_policy
+from parallel import SharedArrays, Strip, strip_bounds
+
+
+class FixedResources:
+    # The strip's generator, except that every collision draws `value`, so
+    # the reference below knows the resource of every contested cell.
+    def __init__(self, seed, value):
+        self.rng = np.random.default_rng(seed)
+        self.value = value
+
+    def random(self, size):
+        return self.rng.random(size)
+
+    def choice(self, *args, **kwargs):
+        return self.rng.choice(*args, **kwargs)
+
+    def integers(self, low, high, size):
+        return np.full(size, self.value, dtype=np.int64)
+
+
+def reference_move(width, height, family, strength, direction, resource, families):
+    # Decay, claim and settle worked out cell by cell from the grids at the
+    # start of the step and the directions the strips picked.
+    organisms = {}
+    for cell in range(width * height):
+        if family[cell] >= 0 and strength[cell] - 1 > 0:
+            organisms[cell] = [int(family[cell]), int(strength[cell]) - 1]
+    claims = {}
+    for cell, (_, decayed) in organisms.items():
+        d = int(direction[cell])
+        x, y = divmod(cell, height)
+        dx, dy = DIRECTIONS[d]
+        assert 0 <= x + dx < width and 0 <= y + dy < height
+        target = (x + dx) * height + y + dy
+        priority = decayed * len(DIRECTIONS) + len(DIRECTIONS) - d
+        if target not in claims or priority > claims[target][0]:
+            claims[target] = (priority, cell)
+    gains = {cell: 0 for cell in organisms}
+    dead = set()
+    moves = {}
+    fights = np.zeros(families, dtype=np.int64)
+    cooperations = np.zeros(families, dtype=np.int64)
+    for target, (_, cell) in claims.items():
+        if target not in organisms:
+            moves[cell] = target
+            continue
+        (attacker_family, attacker), (defender_family, defender) = organisms[cell], organisms[target]
+        fight, attacker_wins, attacker_gain, defender_gain = default_policy(
+            attacker_family == defender_family, attacker, defender, resource
+        )
+        gains[cell] += attacker_gain
+        gains[target] += defender_gain
+        if fight:
+            dead.add(target if attacker_wins else cell)
+            fights[attacker_family if attacker_wins else defender_family] += 1
+            if attacker_wins:
+                moves[cell] = target
+        else:
+            cooperations[attacker_family] += 1
+            cooperations[defender_family] += 1
+    final_family = np.full(width * height, -1, dtype=np.int64)
+    final_strength = np.zeros(width * height, dtype=np.int64)
+    for cell, (organism_family, decayed) in organisms.items():
+        if cell in dead:
+            continue
+        where = moves.get(cell, cell)
+        assert final_family[where] < 0
+        final_family[where] = organism_family
+        final_strength[where] = min(decayed + gains[cell], MAX_STRENGTH)
+    return final_family, final_strength, fights, cooperations
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+@pytest.mark.parametrize("resource", [1, 4, 9])
+def test_strips_match_cell_by_cell_reference(workers, resource):
+    width, height, families = 11, 7, 3
+    arrays = SharedArrays(width * height, list(range(families)), workers)
+    try:
+        setup = np.random.default_rng(resource * 10 + workers)
+        arrays.clear()
+        arrays.family[:] = np.where(setup.random(width * height) < 0.6, setup.integers(0, families, width * height), -1)
+        arrays.strength[:] = np.where(arrays.family >= 0, setup.integers(1, MAX_STRENGTH + 1, width * height), 0)
+        strips = [
+            Strip(arrays, width, height, bounds, 10, families, arrays.stats[index], FixedResources(index, resource))
+            for index, bounds in enumerate(strip_bounds(width, workers))
+        ]
+        for _ in range(6):
+            family = arrays.family.astype(np.int64)
+            strength = arrays.strength.astype(np.int64)
+            stats = arrays.stats.sum(axis=0)
+            for strip in strips:
+                strip.decay()
+            for strip in strips:
+                strip.claim()
+            for strip in strips:
+                strip.settle()
+            expected_family, expected_strength, fights, cooperations = reference_move(
+                width, height, family, strength, arrays.direction, resource, families
+            )
+            assert (arrays.family == expected_family).all()
+            assert (arrays.strength == expected_strength).all()
+            totals = arrays.stats.sum(axis=0)
+            assert (totals[:, FIGHTS] - stats[:, FIGHTS] == fights).all()
+            assert (totals[:, COOPERATIONS] - stats[:, COOPERATIONS] == cooperations).all()
+            for strip in strips:
+                strip.local()
+            assert ((arrays.strength > 0) == (arrays.family >= 0)).all()
+            assert arrays.strength.max() <= MAX_STRENGTH
+    finally:
+        del strips
+        arrays.close()
@@ -0,0 +1,38 @@
+import pytest
+
+from population import PopulationStore
+from seeding import Seeding
+from sim import Simulation
+
+
+@pytest.mark.parametrize("synchronous", [False, True])
+def test_store_runs_like_organisms_and_recycles_slots(synchronous):
+    # A shrinking population, so slots are freed, reused and compacted.
+    seeding = Seeding(80, "2-9")
+    plain = Simulation(60, 60, 10, seed=3, synchronous=synchronous, seeding=seeding)
+    stored = Simulation(60, 60, 10, seed=3, synchronous=synchronous, seeding=seeding, store=True)
+    store = stored.store
+    capacity = store.capacity
+    compactions = 0
+    for _ in range(30):
+        top = store.top
+        plain.step()
+        stored.step()
+        compactions += store.top < top
+        assert stored.occupied_cells() == plain.occupied_cells()
+        assert stored.family_stats == plain.family_stats
+        assert len(store) == len(stored.organisms)
+        assert sorted(organism.slot for organism in stored.organisms) == store.live_slots().tolist()
+    assert compactions
+    assert store.capacity == capacity
+
+
+def test_compact_moves_views():
+    store = PopulationStore("AB", capacity=8)
+    views = [store.new(family % 2, strength) for family, strength in enumerate(range(1, 9))]
+    for view in views[:6]:
+        store.remove(view.slot)
+    store.compact(views[6:])
+    assert [view.slot for view in views[6:]] == [0, 1]
+    assert [(view.family, view.strength) for view in views[6:]] == [(0, 7), (1, 8)]
+    assert store.top == 2
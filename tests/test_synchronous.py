@@ -0,0 +1,78 @@
+import random
+
+import pytest
+
+from events import EventStream, MemoryWriter
+from outcomes import MAX_STRENGTH
+from seeding import Seeding
+from sim import Grid, Organism, Simulation
+
+
+def state(simulation):
+    x, y, family, strength = simulation.organism_arrays()
+    return sorted(zip(x.tolist(), y.tolist(), family.tolist(), strength.tolist())), simulation.family_stats
+
+
+@pytest.mark.parametrize("width, height, topology, neighbourhood", [
+    (30, 20, "bounded", "von-neumann"),
+    (30, 20, "torus", "moore"),
+    (1, 40, "torus", "von-neumann"),
+    (2, 25, "torus", "von-neumann"),
+    (2, 25, "torus", "moore"),
+])
+def test_order_of_organisms_does_not_matter(width, height, topology, neighbourhood):
+    shuffle = random.Random(0)
+    simulations = [
+        Simulation(
+            width, height, width * height // 3, seed=4, topology=topology, neighbourhood=neighbourhood,
+            synchronous=True, seeding=Seeding(width * height // 15, "3-9"),
+        )
+        for _ in range(2)
+    ]
+    for _ in range(25):
+        if simulations[0].should_stop():
+            break
+        shuffle.shuffle(simulations[1].organisms)
+        for simulation in simulations:
+            simulation.step()
+        assert state(simulations[0]) == state(simulations[1])
+
+
+def test_events_report_capped_strengths():
+    simulation = Simulation(30, 20, 300, seed=2, synchronous=True, seeding=Seeding(40, "8-10"))
+    writer = MemoryWriter()
+    events = EventStream()
+    events.subscribe(writer, ["fight", "cooperate"])
+    simulation.attach_events(events)
+    simulation.run(10)
+    events.close()
+    columns = writer.columns()
+    assert len(columns["strength"])
+    assert columns["strength"].max() <= MAX_STRENGTH
+    assert columns["other_strength"].max() <= MAX_STRENGTH
+
+
+class FirstChoice(random.Random):
+    # Every organism takes its first open move.
+    def choice(self, seq):
+        return seq[0]
+
+
+def test_events_report_final_strengths():
+    # On a 3x1 grid of one family, A moves onto B while B moves onto C, so B
+    # cooperates twice: once as occupant, once as claimant.
+    grid = Grid(3, 1)
+    organisms = [Organism(0, strength) for strength in (6, 6, 3)]
+    for x, organism in enumerate(organisms):
+        grid.place_organism(organism, x, 0)
+    simulation = Simulation.from_grid(grid, organisms, 0, rng=FirstChoice(1), families=["A"])
+    simulation.synchronous = True
+    writer = MemoryWriter()
+    events = EventStream()
+    events.subscribe(writer, ["cooperate"])
+    simulation.attach_events(events)
+    simulation.step()
+    events.close()
+    columns = writer.columns()
+    assert columns["x"].tolist() == [1, 2]
+    assert columns["other_strength"][0] == columns["strength"][1]
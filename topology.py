@@ -0,0 +1,103 @@
+# Directions in tie-break order: when two equally strong organisms move
+# towards the same cell, the one arriving along the earlier direction claims
+# it. The first four are Grid's original von Neumann order.
+VON_NEUMANN = ((1, 0), (-1, 0), (0, 1), (0, -1))
+MOORE = VON_NEUMANN + ((1, 1), (1, -1), (-1, 1), (-1, -1))
+NEIGHBOURHOODS = {"von-neumann": VON_NEUMANN, "moore": MOORE}
+TOPOLOGIES = ("bounded", "torus")
+
+
+def directions(neighbourhood):
+    if neighbourhood not in NEIGHBOURHOODS:
+        raise ValueError(f"unknown neighbourhood {neighbourhood!r}")
+    return NEIGHBOURHOODS[neighbourhood]
+
+
+def check_topology(topology):
+    if topology not in TOPOLOGIES:
+        raise ValueError(f"unknown topology {topology!r}")
+
+
+def open_moves(x, y, width, height, topology="bounded", neighbourhood="von-neumann"):
+    # (direction index, (x, y)) for every cell an organism at (x, y) can move
+    # to, in direction order. On a torus narrower than three cells two
+    # directions can wrap onto the same cell, or onto the cell itself; each
+    # cell is only reachable through the first direction that leads to it.
+    check_topology(topology)
+    moves = []
+    seen = {(x, y)}
+    for direction, (dx, dy) in enumerate(directions(neighbourhood)):
+        nx, ny = x + dx, y + dy
+        if topology == "torus":
+            nx, ny = nx % width, ny % height
+        elif not (0 <= nx < width and 0 <= ny < height):
+            continue
+        if (nx, ny) not in seen:
+            seen.add((nx, ny))
+            moves.append((direction, (nx, ny)))
+    return moves
+
+
+def border_moves(width, height, topology="bounded", neighbourhood="von-neumann"):
+    # Which directions are open only depends on whether a cell is on the
+    # first or last column and row, so cells fall into 16 border classes (see
+    # border_class()). Returns each class's open moves as (direction, dx, dy)
+    # tuples in direction order, in a list indexed by class; classes no cell
+    # of this grid belongs to have no moves. On a torus every class has the
+    # same moves.
+    check_topology(topology)
+    offsets = directions(neighbourhood)
+    rows = []
+    for border in range(16):
+        x = representative(border >> 2, width)
+        y = representative(border & 3, height)
+        if x is None or y is None:
+            rows.append(())
+            continue
+        rows.append(tuple([(direction, *offsets[direction]) for direction, _ in open_moves(x, y, width, height, topology, neighbourhood)]))
+    return rows
+
+
+def border_class(x, y, width, height):
+    return ((x == 0) + 2 * (x == width - 1)) * 4 + (y == 0) + 2 * (y == height - 1)
+
+
+def representative(bits, size):
+    # A coordinate whose first/last flags (bit 0 / bit 1) are bits, or None
+    # if no coordinate on an axis of this size has them.
+    for value in (0, min(1, size - 1), size - 1):
+        if (value == 0) + 2 * (value == size - 1) == bits:
+            return value
+    return None
+
+
+class MoveTable:
+    # The array engine's version of border_moves: moves[c, :counts[c]] lists
+    # class c's open directions in order.
+    def __init__(self, width, height, topology="bounded", neighbourhood="von-neumann"):
+        import numpy as np
+
+        self.width = width
+        self.height = height
+        self.topology = topology
+        self.neighbourhood = neighbourhood
+        self.offsets = np.array(directions(neighbourhood), dtype=np.int64)
+        count = len(self.offsets)
+        self.moves = np.zeros((16, count), dtype=np.int64)
+        self.counts = np.zeros(16, dtype=np.int64)
+        for border, row in enumerate(border_moves(width, height, topology, neighbourhood)):
+            self.moves[border, :len(row)] = [direction for direction, _, _ in row]
+            self.counts[border] = len(row)
+        # Classes whose organisms can take any direction.
+        self.unrestricted = self.counts == count
+
+    def border(self, x, y):
+        return border_class(x, y, self.width, self.height)
+
+    def targets(self, x, y, direction):
+        target_x = x + self.offsets[direction, 0]
+        target_y = y + self.offsets[direction, 1]
+        if self.topology == "torus":
+            target_x %= self.width
+            target_y %= self.height
+        return target_x, target_y